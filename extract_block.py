@@ -10,11 +10,14 @@ import warnings
 warnings.filterwarnings('ignore')
 import time
 import numpy as np
-from scipy import signal
-from scipy.signal import butter, iirnotch, filtfilt
-from sklearn.cross_decomposition import CCA
 from scipy.linalg import inv
 
+from tlcca_preprocessing import TLCCAPreprocessor
+from tlcca_scoring import ReferenceBank, regularized_canoncorr
+
+# Number of times matlab_canoncorr_exact fell back to the regularized CCA
+canoncorr_fallback_count = 0
+
 def matlab_canoncorr_exact(X, Y):
     """MATLAB canoncorr implementation - fully consistent with beta.py"""
     if X.ndim == 1:
@@ -49,10 +52,10 @@ def matlab_canoncorr_exact(X, Y):
         return A, B
         
     except:
-        # Backup solution
-        cca = CCA(n_components=1)
-        cca.fit(X, Y)
-        return cca.x_weights_[:, 0], cca.y_weights_[:, 0]
+        # Backup solution: deterministic regularized eigendecomposition CCA
+        global canoncorr_fallback_count
+        canoncorr_fallback_count += 1
+        return regularized_canoncorr(X, Y)
 
 def matlab_square(t, duty=20):
     """MATLAB square function - fully consistent with beta.py"""
@@ -136,6 +139,9 @@ class FixedTLCCATrainer:
         # ===== Key Fix: frequency-phase setup consistent with beta.py =====
         self._setup_frequency_phase_beta()
         
+        # Reference bank over all (reordered) stimuli, shared by every sub-band and class
+        self.ref_bank = ReferenceBank(self.sti_f, self.pha_val, self.num_of_harmonics, self.Fs, max_len=2 * self.Fs)
+        
         # ===== Filter setup consistent with beta.py =====
         self._setup_filters_beta()
         
@@ -181,34 +187,9 @@ class FixedTLCCATrainer:
     def _setup_filters_beta(self):
         """Filter setup consistent with beta.py"""
         
-        subband_signal = {}
-        for k in range(1, self.num_of_subbands + 1):
-            Wp = np.array([(8*k)/(self.Fs/2), 90/(self.Fs/2)])
-            Ws = np.array([(8*k-2)/(self.Fs/2), 100/(self.Fs/2)])
-            
-            try:
-                N, Wn = signal.cheb1ord(Wp, Ws, 3, 40)
-                b, a = signal.cheby1(N, 0.5, Wn, btype='band')
-                subband_signal[k] = {'bpB': b, 'bpA': a}
-            except:
-                b, a = signal.butter(6, Wn, btype='band')
-                subband_signal[k] = {'bpB': b, 'bpA': a}
-        
-        self.subband_signal = subband_signal
-        
-        Fo = 50
-        Q  = 35
-        M  = int(np.floor((self.Fs/2) / Fo))
-        notchB = np.array([1.0])
-        notchA = np.array([1.0])
-        for k in range(1, M+1):
-            w0 = (k * Fo) / (self.Fs/2)
-            b_k, a_k = signal.iirnotch(w0, Q)
-            notchB = np.convolve(notchB, b_k)
-            notchA = np.convolve(notchA, a_k)
-        
-        self.notchB = notchB
-        self.notchA = notchA
+        # Notch + sub-band designs (SOS) shared with the recognition engines
+        self.preprocessor = TLCCAPreprocessor(self.Fs, self.num_of_subbands)
+        self.subband_signal = {k: {} for k in range(1, self.num_of_subbands + 1)}
 
     def load_subject_data(self, subject_num):
         
@@ -266,61 +247,41 @@ class FixedTLCCATrainer:
         
         self._reorganize_data_beta()
   
+        fallbacks_before = canoncorr_fallback_count
         self._train_model_beta(d3)
         
+        if canoncorr_fallback_count > fallbacks_before:
+            print(f'    ⚠️ CCA fallback used {canoncorr_fallback_count - fallbacks_before} times')
         print('  ✅ Model training completed')
         return self.subband_signal
 
     def _preprocess_data_beta(self, eeg_data, training_blocks, d1, d2, d3, d4):
+        """Notch + sub-band filtering of all training trials - one filter call per band
 
-        processed_count = 0
-        total_to_process = d1 * len(training_blocks)
-        
-        for i in range(d1):
-            for j_enum, j in enumerate(training_blocks):
-                j_idx = j - 1
-                
-               
-                y0 = eeg_data[:, :, i, j_idx]
-                
-         
-                try:
-                    y_temp = signal.filtfilt(self.notchB, self.notchA, y0.T)
-                    y = y_temp.T
-                except:
-                    y = y0
-                
-                for sub_band in range(1, self.num_of_subbands + 1):
-                    y_sb = np.zeros((d3, 2*self.Fs))
-                    
-                    for ch_no in range(d3):
-                        try:
-                            tmp2 = signal.filtfilt(self.subband_signal[sub_band]['bpB'], 
-                                                 self.subband_signal[sub_band]['bpA'], 
-                                                 y[ch_no, :])
-                        except:
-                            tmp2 = y[ch_no, :]
-                        
-                
-                        start_cut = self.latencyDelay
-                        end_cut = self.latencyDelay + 2*self.Fs
-                        
-                        if end_cut <= len(tmp2):
-                            y_sb[ch_no, :] = tmp2[start_cut:end_cut]
-                        elif start_cut < len(tmp2):
-                            available_len = len(tmp2) - start_cut
-                            y_sb[ch_no, :available_len] = tmp2[start_cut:]
-                    
-            
-                    if 'SSVEPdata' not in self.subband_signal[sub_band]:
-                        self.subband_signal[sub_band]['SSVEPdata'] = np.zeros((d3, 2*self.Fs, len(training_blocks), d1))
-                    self.subband_signal[sub_band]['SSVEPdata'][:, :, j_enum, i] = y_sb
-                
-                processed_count += 1
-                if processed_count % 20 == 0:
-                    print(f'      process: {processed_count}/{total_to_process} ({processed_count/total_to_process*100:.1f}%)')
-        
-        print(f'    ✅ Preprocessing completed: {processed_count}/{total_to_process}')
+        Filters the whole (channels, time, freq, block) array along the time axis and
+        writes the latency-cut 2 s segments straight into preallocated SSVEPdata
+        (channels, time, block, freq), instead of one filtfilt per channel and trial.
+        """
+        block_idx = np.asarray(training_blocks, dtype=int) - 1
+        data = eeg_data[:, :, :, block_idx]
+
+        # NOTE: as before, the notch runs along the channel axis (the last axis of y0.T per
+        # trial); 9 channels are shorter than its padding, so the data stay unfiltered.
+        # Kept unchanged so retrained models match the existing ones.
+        data = self.preprocessor.notch(data, axis=0)
+
+        start_cut = self.latencyDelay
+        end_cut = min(self.latencyDelay + 2*self.Fs, d4)
+        available_len = max(0, end_cut - start_cut)
+
+        for sub_band in range(1, self.num_of_subbands + 1):
+            ssvep = np.zeros((d3, 2*self.Fs, len(training_blocks), d1))
+            # All channels, frequencies and blocks in one call along time
+            filtered = self.preprocessor.subband(data, sub_band, axis=1)
+            ssvep[:, :available_len] = filtered[:, start_cut:end_cut].transpose(0, 1, 3, 2)
+            self.subband_signal[sub_band]['SSVEPdata'] = ssvep
+
+        print(f'    ✅ Preprocessing completed: {d1 * len(training_blocks)}/{d1 * len(training_blocks)}')
 
     def _reorganize_data_beta(self):
       
@@ -340,20 +301,10 @@ class FixedTLCCATrainer:
         
     
         print('      🔧 Generating source frequency reference signals...')
+        refs = self.ref_bank.references(dataLength)
         ref_source = {}
         for i in range(len(self.source_freq_idx)):
-            freq_idx = self.source_freq_idx[i]
-            testFres = self.sti_f[freq_idx] * np.arange(1, self.num_of_harmonics + 1)
-            t = np.arange(dataLength) / self.Fs
-            
-            ref_signal = []
-            for h in range(self.num_of_harmonics):
-                cos_comp = np.cos(2 * np.pi * testFres[h] * t + self.pha_val[freq_idx] * (h + 1))
-                sin_comp = np.sin(2 * np.pi * testFres[h] * t + self.pha_val[freq_idx] * (h + 1))
-                ref_signal.append(cos_comp)
-                ref_signal.append(sin_comp)
-            
-            ref_source[i] = np.array(ref_signal)
+            ref_source[i] = refs[self.source_freq_idx[i]]
         
        
         for sub_band in range(1, self.num_of_subbands + 1):
@@ -577,11 +528,8 @@ class FixedTLCCATrainer:
                     y0 = eeg_data[:, :, freq_idx, block_idx]
                     
                     
-                    try:
-                        y_temp = signal.filtfilt(self.notchB, self.notchA, y0.T)
-                        y = y_temp.T
-                    except:
-                        y = y0
+                    # Same notch call as in training (see _preprocess_data_beta)
+                    y = self.preprocessor.notch(y0.T).T
 
                     
                     start_cut = self.latencyDelay
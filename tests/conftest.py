@@ -0,0 +1,84 @@
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pytest
+import scipy.io as sio
+
+# The modules live at the repository root (no package)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tlcca_model import CompiledTLCCAModel, compile_char_table
+
+ENGINE_FILES = {'try222': 'try222.py', 'eeg_processor': 'eeg processor.py'}
+
+
+def _random_model(rng, channels=9, harmonics=5, bands=5):
+    """Random 40-class model file contents: shuffled target order, even positions source domain, odd transfer"""
+    positions = np.arange(40)
+    contents = {'target_order': rng.permutation(40), 'sti_f': 8.0 + 0.2 * positions,
+                'pha_val': (0.5 * np.pi * positions) % (2 * np.pi),
+                'source_freq_idx': positions[0::2], 'target_freq_idx': positions[1::2]}
+    for band in range(1, bands + 1):
+        contents[f'Wx_source_band{band}'] = rng.standard_normal((channels, 20))
+        contents[f'Wy_source_band{band}'] = rng.standard_normal((2 * harmonics, 20))
+        contents[f'Wx_transfer_band{band}'] = rng.standard_normal((channels, 20))
+        contents[f'templates_transfer_band{band}'] = rng.standard_normal((250, 20))
+    return contents
+
+
+@pytest.fixture(scope='session', autouse=True)
+def filter_cache(tmp_path_factory):
+    """Keep the shared filter-design registry out of the user's cache directory"""
+    path = tmp_path_factory.mktemp('filters') / 'filter_designs.npz'
+    previous = os.environ.get('TLCCA_FILTER_CACHE')
+    os.environ['TLCCA_FILTER_CACHE'] = str(path)
+    yield path
+    if previous is None:
+        os.environ.pop('TLCCA_FILTER_CACHE')
+    else:
+        os.environ['TLCCA_FILTER_CACHE'] = previous
+
+
+@pytest.fixture(scope='session')
+def model_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp('model') / 'S1_tlcca_model_exclude_1.mat'
+    sio.savemat(path, _random_model(np.random.default_rng(7)))
+    return str(path)
+
+
+@pytest.fixture(scope='session', params=sorted(ENGINE_FILES))
+def engine_module(request):
+    """Each recognition engine, imported from its file ('eeg processor.py' is not importable by name)"""
+    spec = importlib.util.spec_from_file_location(request.param, os.path.join(ROOT, ENGINE_FILES[request.param]))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def engine(engine_module, model_path):
+    """A recognition engine with the random model loaded"""
+    recognizer = engine_module.TLCCAOnlineRecognition(recognition_window=0.8)
+    assert recognizer.load_pretrained_model(model_path)
+    return recognizer
+
+
+@pytest.fixture(scope='session')
+def tlcca_model():
+    """Random 40-class, 5-band, 9-channel model: even classes source domain, odd classes transfer"""
+    rng = np.random.default_rng(42)
+    Fs, channels, harmonics, bands = 250, 9, 5, 5
+    classes = np.arange(40)
+    char_table = compile_char_table(classes, 8.0 + 0.2 * classes, (0.5 * np.pi * classes) % (2 * np.pi),
+                                    source_freq_idx=classes[0::2], target_freq_idx=classes[1::2])
+    weights, templates = {}, {}
+    for band in range(1, bands + 1):
+        weights[f'Wx_source_band{band}'] = rng.standard_normal((channels, 20))
+        weights[f'Wy_source_band{band}'] = rng.standard_normal((2 * harmonics, 20))
+        weights[f'Wx_transfer_band{band}'] = rng.standard_normal((channels, 20))
+        templates[f'templates_transfer_band{band}'] = rng.standard_normal((250, 20))
+    FB_coef = np.arange(1, bands + 1) ** -1.25 + 0.25
+    return CompiledTLCCAModel.from_weights(weights, templates, char_table, FB_coef, harmonics, Fs)
@@ -0,0 +1,179 @@
+import time
+
+import numpy as np
+import pytest
+from scipy import signal
+
+from tlcca_acquisition import AcquisitionPipeline, PolyphaseResampler, ReplaySource, SampleRingBuffer
+
+
+def _stream(channels=3, samples=2000, seed=0):
+    return np.random.default_rng(seed).standard_normal((channels, samples))
+
+
+@pytest.mark.parametrize('input_rate, output_rate', [(500, 250), (1000, 250), (300, 250), (250, 250), (200, 250)])
+@pytest.mark.parametrize('chunk', [1, 7, 40, 2000])
+def test_resampler_matches_resample_poly(input_rate, output_rate, chunk):
+    x = _stream()
+    resampler = PolyphaseResampler(input_rate, output_rate, x.shape[0])
+    pieces = [resampler.process(x[:, i:i + chunk]) for i in range(0, x.shape[1], chunk)]
+    pieces.append(resampler.flush())
+    y = np.concatenate(pieces, axis=1)
+
+    expected = signal.resample_poly(x, resampler.up, resampler.down, axis=1)
+    assert y.shape == expected.shape
+    np.testing.assert_allclose(y, expected, rtol=0, atol=1e-12)
+
+
+def test_resampler_emits_with_fixed_lag():
+    x = _stream(samples=1000)
+    resampler = PolyphaseResampler(500, 250, x.shape[0])
+    emitted = 0
+    for i in range(0, x.shape[1], 10):
+        emitted += resampler.process(x[:, i:i + 10]).shape[1]
+        # Everything whose filter support has arrived is out, nothing more
+        available = i + 10 - resampler.lag_samples
+        assert emitted == max(0, int(np.floor((available - 1) / 2)) + 1)
+
+
+@pytest.mark.parametrize('chunk', [1, 7, 33, 64, 150])
+def test_ring_buffer_wraps_around(chunk):
+    x = _stream(channels=4, samples=500)
+    ring = SampleRingBuffer(x.shape[0], 64)
+    for i in range(0, x.shape[1], chunk):
+        ring.append(x[:, i:i + chunk])
+        total = min(i + chunk, x.shape[1])
+        assert ring.total == total and ring.start == max(0, total - 64)
+        # Every held range reads back, wrapped or not
+        for start in range(ring.start, total, 9):
+            np.testing.assert_array_equal(ring.window(start, total), x[:, start:total])
+    np.testing.assert_array_equal(ring[:, 436:500], x[:, 436:])
+
+
+def test_ring_buffer_window_copies_into_out_when_wrapped():
+    x = _stream(channels=2, samples=100)
+    ring = SampleRingBuffer(2, 32)
+    ring.append(x[:, :90])
+    view = ring.window(64, 80)  # contiguous in storage
+    assert np.shares_memory(view, ring._data)
+    out = np.empty((2, 30))
+    assert ring.window(60, 90, out=out) is out  # wraps at 64
+    np.testing.assert_array_equal(out, x[:, 60:90])
+
+
+def test_ring_buffer_rejects_evicted_and_future_samples():
+    x = _stream(channels=2, samples=100)
+    ring = SampleRingBuffer(2, 32)
+    ring.append(x)
+    assert ring.window(67, 100) is None
+    assert ring.window(68, 101) is None
+    assert ring.window(68, 100) is not None
+    with pytest.raises(IndexError):
+        ring[:, 50:100]
+    with pytest.raises(TypeError):
+        ring[0, 80:90]
+
+
+def test_ring_buffer_epoch_is_new_per_buffer_and_reset():
+    ring, other = SampleRingBuffer(2, 32), SampleRingBuffer(2, 32)
+    epoch = ring.epoch
+    assert other.epoch != epoch
+    ring.append(_stream(channels=2, samples=10))
+    assert ring.epoch == epoch
+    ring.reset()
+    assert ring.epoch not in (epoch, other.epoch) and ring.total == 0
+
+
+class _ListSource:
+    """Device stand-in releasing fixed (first_sample, chunk) pairs"""
+
+    Fs = 250
+    paced = True
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def start(self):
+        pass
+
+    def read(self):
+        return self.chunks.pop(0) if self.chunks else None
+
+
+def _ring_stage(ring, log=None):
+    def stage(chunk):
+        ring.append(chunk)
+        if log is not None:
+            log.append(ring.total)
+        return chunk.shape[-1]
+    return stage
+
+
+def test_pipeline_delivers_every_sample_in_order():
+    x = _stream(samples=1000)
+    ring = SampleRingBuffer(x.shape[0], x.shape[1])
+    pipeline = AcquisitionPipeline(ReplaySource(x, 250, 7), _ring_stage(ring), queue_size=4)
+    pipeline.start()
+    try:
+        assert pipeline.wait_for(x.shape[1])
+        assert not pipeline.wait_for(x.shape[1] + 1)  # source exhausted
+    finally:
+        pipeline.stop()
+
+    np.testing.assert_array_equal(ring.window(0, x.shape[1]), x)
+    stats = pipeline.stats()
+    assert stats['chunks'] == int(np.ceil(x.shape[1] / 7))
+    assert stats['dropped_chunks'] == stats['dropped_samples'] == stats['gaps'] == 0
+    assert stats['buffer_latency']['count'] >= stats['chunks']
+
+
+def test_pipeline_buffers_ahead_within_ring_capacity():
+    x = _stream(samples=1000)
+    ring = SampleRingBuffer(x.shape[0], 100)
+    written = []
+    pipeline = AcquisitionPipeline(ReplaySource(x, 250, 8), _ring_stage(ring, written), capacity=100)
+    pipeline.start()
+    try:
+        assert pipeline.wait_for(10, keep_from=0)
+        deadline = time.monotonic() + 5.0
+        while pipeline.buffered < 99 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        # Ahead of the scorer, but never over samples it still reads
+        assert pipeline.buffered == 99
+        np.testing.assert_array_equal(ring.window(0, 99), x[:, :99])
+
+        assert pipeline.wait_for(300, keep_from=250)
+        np.testing.assert_array_equal(ring.window(250, 300), x[:, 250:300])
+        assert max(written) <= 250 + 100
+    finally:
+        pipeline.stop()
+
+
+def test_pipeline_rejects_dropping_from_an_unpaced_source():
+    x = _stream(samples=100)
+    with pytest.raises(ValueError):
+        AcquisitionPipeline(ReplaySource(x, 250, 10), lambda chunk: chunk.shape[-1], drop_when_full=True)
+    AcquisitionPipeline(ReplaySource(x, 250, 10, clock=time.monotonic), lambda chunk: chunk.shape[-1],
+                        drop_when_full=True)
+
+
+def test_pipeline_zero_fills_and_flags_lost_samples():
+    x = _stream(samples=40)
+    ring = SampleRingBuffer(x.shape[0], 40)
+    source = _ListSource([(0, x[:, :10]), (10, x[:, 10:20]), (30, x[:, 30:40])])  # [20, 30) lost
+    pipeline = AcquisitionPipeline(source, _ring_stage(ring))
+    pipeline.start()
+    try:
+        assert pipeline.wait_for(40)
+    finally:
+        pipeline.stop()
+
+    expected = x.copy()
+    expected[:, 20:30] = 0
+    np.testing.assert_array_equal(ring.window(0, 40), expected)
+    assert pipeline.window_has_gap(15, 25)
+    assert pipeline.window_has_gap(0, 40)
+    assert not pipeline.window_has_gap(0, 20)
+    assert not pipeline.window_has_gap(30, 40)
+    assert pipeline.stats()['gaps'] == 1
+    assert pipeline.stats()['gap_samples'] == 10
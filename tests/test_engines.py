@@ -0,0 +1,162 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+import scipy.io as sio
+from scipy import signal
+
+from tlcca_scoring import canoncorr_basis, canoncorr_correlations, generate_reference_bank
+
+
+def _engine_r3(engine, x, Y):
+    """r3 exactly as the per-character path computes it: matlab_canoncorr_exact, then |corr|"""
+    A, B = engine.matlab_canoncorr_exact(x.reshape(-1, 1), Y.T)
+    return engine.calculate_correlation((x.reshape(-1, 1) @ A.reshape(-1, 1)).ravel(), (Y.T @ B.reshape(-1, 1)).ravel())
+
+
+def test_batched_scores_match_per_character_loop(engine):
+    rng = np.random.default_rng(0)
+    for length in (200, 157):
+        window = rng.standard_normal((9, length))
+        np.testing.assert_allclose(engine.calculate_tlcca_scores_for_all_chars(window),
+                                   engine.calculate_tlcca_scores_loop(window), rtol=1e-9, atol=1e-12)
+
+
+def test_score_batch_matches_per_window_scoring(engine):
+    windows = np.random.default_rng(2).standard_normal((4, 9, 200))
+    expected = [engine.calculate_tlcca_scores_for_all_chars(window) for window in windows]
+    np.testing.assert_allclose(engine.score_batch(windows), expected, rtol=1e-12, atol=1e-14)
+
+    # Mixed lengths: equal-length windows are batched together, rows come back in request order
+    source = np.random.default_rng(3).standard_normal((9, 1000))
+    ranges = [(0, 200), (100, 257), (300, 500), (500, 657), (700, 700)]
+    expected = [engine.calculate_tlcca_scores_for_all_chars(source[:, s:e]) if e > s else np.zeros(40)
+                for s, e in ranges]
+    np.testing.assert_allclose(engine.score_sample_windows(ranges, source), expected, rtol=1e-12, atol=1e-14)
+
+
+@pytest.mark.parametrize('reference', ['harmonic', 'random', 'one_column'])
+def test_qr_canoncorr_matches_matlab_canoncorr_exact(engine, reference):
+    rng = np.random.default_rng(1)
+    T = 157
+    if reference == 'harmonic':
+        refs = generate_reference_bank(8.0 + 0.2 * np.arange(6), 0.5 * np.pi * np.arange(6), T, 5, 250)
+    elif reference == 'random':
+        # Correlated columns: Ly is far from diagonal, so the Ly^-T Ly^-T weighting matters
+        refs = rng.standard_normal((6, 10, T)) + rng.standard_normal((6, 1, T))
+    else:
+        refs = rng.standard_normal((6, 1, T))
+    X = rng.standard_normal((6, T))
+    Q, C = canoncorr_basis(refs)
+
+    r3 = canoncorr_correlations(X, Q, C)
+    expected = [_engine_r3(engine, x, Y) for x, Y in zip(X, refs)]
+    np.testing.assert_allclose(r3, expected, rtol=1e-9, atol=1e-12)
+    if reference == 'random':
+        # The textbook first canonical correlation |Q^T x| / |x| is not what the engines compute
+        Xc = X - X.mean(axis=1, keepdims=True)
+        textbook = np.linalg.norm(np.einsum('ct,ctk->ck', Xc, Q), axis=1) / np.linalg.norm(Xc, axis=1)
+        assert np.max(np.abs(textbook - r3)) > 1e-3
+
+
+def test_project_first_scores_on_the_per_character_path(engine, monkeypatch):
+    source = np.random.default_rng(5).standard_normal((9, 600))
+    windows = np.stack([source[:, 0:200], source[:, 300:500]])
+    expected = engine.score_batch(windows)
+
+    filtered_rows = []
+    apply_subband_filter = engine.apply_subband_filter
+
+    def spy(data, sub_band):
+        filtered_rows.append(data.shape[0])
+        return apply_subband_filter(data, sub_band)
+
+    monkeypatch.setattr(engine, 'apply_subband_filter', spy)
+    engine.set_scoring_order('project_first')
+    # Filtering and projection are both linear per row, so only rounding separates the orders
+    np.testing.assert_allclose(engine.calculate_tlcca_scores_for_all_chars(windows[0]), expected[0],
+                               rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(engine.calculate_tlcca_scores_for_samples(300, 500, source), expected[1],
+                               rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(engine.score_batch(windows), expected, rtol=1e-9, atol=1e-12)
+    assert filtered_rows and set(filtered_rows) == {1}  # only projected 1-D traces were filtered
+
+
+def _load_block(engine, tmp_path, **fields):
+    """Load a random 4-trial block through load_source_data, as written by extract_block.py plus `fields`"""
+    trials = np.random.default_rng(5).standard_normal((9, 750, 4))
+    sio.savemat(tmp_path / 'block.mat', {'block_1_data': trials, **fields})
+    assert engine.load_source_data(str(tmp_path / 'block.mat'), 1)
+
+
+def test_streaming_ticks_fill_the_ring_with_the_source(engine, tmp_path):
+    _load_block(engine, tmp_path, Fs=250.0)
+    ring, total = engine.streaming_buffer, engine.total_samples
+    # Repeated and sub-sample ticks deliver nothing; the 0.5 s -> 10 s gap delivers everything
+    # due at once and the ring keeps only its newest samples; ticks past the end stop at total_samples
+    delivered = 0
+    for current_time in (0.02, 0.02, 0.5, 0.5019, 10.0, 10.013, 20.0, 21.0):
+        delivered += engine.simulate_data_streaming(current_time)
+        expected = min(int(current_time * engine.Fs), total)
+        assert engine.received_samples == ring.total == delivered == expected
+        assert ring.start == max(0, expected - ring.capacity)
+        np.testing.assert_array_equal(ring.window(ring.start, expected), engine.source_data[:, ring.start:expected])
+
+
+
+def test_ingest_resamples_amplifier_chunks(engine, tmp_path):
+    engine.set_acquisition_rate(500)
+    _load_block(engine, tmp_path)  # no 'Fs' key: already at the model rate, not decimated again
+    assert engine.total_samples == 3000
+    x = np.random.default_rng(6).standard_normal((9, 1000))  # 2 s at the amplifier rate
+    delivered = sum(engine.ingest(x[:, i:i + 20]) for i in range(0, x.shape[1], 20))
+    expected = signal.resample_poly(x, 1, 2, axis=1)
+    assert engine.received_samples == delivered == engine.stream_resampler.samples_out
+    np.testing.assert_allclose(engine.streaming_buffer.window(0, delivered), expected[:, :delivered], rtol=0, atol=1e-12)
+
+
+def test_filtered_bank_cache_tells_block_and_streams_apart(engine, tmp_path):
+    _load_block(engine, tmp_path, Fs=250.0)
+    block_scores = engine.calculate_tlcca_scores_for_samples(100, 300)
+    # A live stream carrying other data at the same sample indices
+    live = np.random.default_rng(8).standard_normal((9, 300))
+    engine.ingest(live, input_rate=engine.Fs)
+    live_scores = engine.calculate_tlcca_scores_for_samples(100, 300, engine.streaming_buffer)
+    np.testing.assert_allclose(live_scores, engine.calculate_tlcca_scores_for_all_chars(live[:, 100:300]), rtol=1e-12)
+    assert not np.allclose(live_scores, block_scores)
+    # ...and after the stream restarts
+    restarted = np.random.default_rng(9).standard_normal((9, 300))
+    engine.streaming_buffer.reset()
+    engine.ingest(restarted, input_rate=engine.Fs)
+    np.testing.assert_allclose(engine.calculate_tlcca_scores_for_samples(100, 300, engine.streaming_buffer),
+                               engine.calculate_tlcca_scores_for_all_chars(restarted[:, 100:300]), rtol=1e-12)
+    np.testing.assert_array_equal(engine.calculate_tlcca_scores_for_samples(100, 300), block_scores)
+
+
+def test_grouped_notch_runs_in_the_workspace(engine):
+    source = np.random.default_rng(10).standard_normal((9, 600))
+    default = engine.calculate_tlcca_scores_for_all_chars(source[:, 0:200])
+    engine.set_adaptive_notch(True)
+    engine.notch_selection = [(50,), (60,), (), (50, 60), (50,), (60,), (50,), (), (50,)]
+    try:
+        engine.set_workspace(False)
+        expected = [engine.calculate_tlcca_scores_for_all_chars(source[:, s:s + n]) for s, n in ((0, 200), (300, 157))]
+        assert not np.allclose(expected[0], default)  # the channel groups really take other notches
+        workspace = engine.set_workspace(True)
+        allocations = workspace.allocations
+        for _ in range(2):
+            for (s, n), scores in zip(((0, 200), (300, 157)), expected):
+                np.testing.assert_allclose(engine.calculate_tlcca_scores_for_samples(s, s + n, source), scores,
+                                           rtol=1e-12, atol=1e-14)
+        assert workspace.allocations == allocations
+        # The per-group windows and banks come from the workspace too: less than one window transient
+        tracemalloc.start()
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        engine.calculate_tlcca_scores_for_samples(0, 200, source)
+        peak = tracemalloc.get_traced_memory()[1] - current
+        tracemalloc.stop()
+        assert peak < source[:, 0:200].nbytes
+    finally:
+        engine.set_workspace(False)
+        engine.set_adaptive_notch(False)
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from tlcca_model import NO_DOMAIN, SOURCE_DOMAIN, TARGET_DOMAIN, CompiledTLCCAModel, compile_char_table
+
+
+def test_char_table_maps_characters_to_domain_columns():
+    # Positions 0-3 show characters 2, 0, 3, 2; position 1 is in both domains
+    table = compile_char_table([2, 0, 3, 2], [8.0, 9.0, 10.0, 11.0], [0.0, 0.5, 1.0, 1.5],
+                               source_freq_idx=[1, 2], target_freq_idx=[0, 1, 3], num_classes=5)
+    np.testing.assert_array_equal(table['reordered_pos'], [1, -1, 0, 2, -1])  # first occurrence wins
+    np.testing.assert_array_equal(table['domain'], [SOURCE_DOMAIN, NO_DOMAIN, TARGET_DOMAIN, SOURCE_DOMAIN,
+                                                    NO_DOMAIN])
+    np.testing.assert_array_equal(table['column'], [0, -1, 0, 1, -1])  # source mapping kept for position 1
+    np.testing.assert_array_equal(table['freq'], [9.0, 0.0, 8.0, 10.0, 0.0])
+    np.testing.assert_array_equal(table['phase'], [0.5, 0.0, 0.0, 1.0, 0.0])
+    np.testing.assert_array_equal(table['pos_domain'], [TARGET_DOMAIN, SOURCE_DOMAIN, SOURCE_DOMAIN, TARGET_DOMAIN])
+    np.testing.assert_array_equal(table['pos_column'], [0, 0, 1, 2])
+    assert all(not array.flags.writeable for array in table.values())
+
+
+def test_compiled_model_gathers_each_characters_weights():
+    rng = np.random.default_rng(0)
+    table = compile_char_table([0, 1, 2, 3], [8.0, 9.0, 10.0, 11.0], [0.0] * 4,
+                               source_freq_idx=[0, 2], target_freq_idx=[1, 3], num_classes=4)
+    weights = {'Wx_source_band1': rng.standard_normal((3, 2)), 'Wy_source_band1': rng.standard_normal((4, 2)),
+               'Wx_transfer_band1': rng.standard_normal((3, 2))}
+    templates = {'templates_transfer_band1': rng.standard_normal((50, 2))}
+    weights['Wx_transfer_band1'][:, 1] = 0  # character 3 has no transfer filter
+    model = CompiledTLCCAModel.from_weights(weights, templates, table, [1.0, 0.5], 2, 250)
+
+    assert (model.num_of_subbands, model.num_classes, model.Wx.shape[1]) == (2, 4, 3)
+    np.testing.assert_array_equal(model.Wx[0], np.stack([weights['Wx_source_band1'][:, 0],
+                                                         weights['Wx_transfer_band1'][:, 0],
+                                                         weights['Wx_source_band1'][:, 1],
+                                                         weights['Wx_transfer_band1'][:, 1]], axis=1))
+    np.testing.assert_array_equal(model.Wy[0][:, [0, 2]], weights['Wy_source_band1'])
+    np.testing.assert_array_equal(model.templates[0][:, [1, 3]], templates['templates_transfer_band1'])
+    np.testing.assert_array_equal(model.r1a_mask[0], [True, False, True, False])
+    np.testing.assert_array_equal(model.r1b_mask[0], [False, True, False, False])
+    np.testing.assert_array_equal(model.r3_mask[0], [True, True, True, False])
+    assert not model.Wx[1].any() and not model.r3_mask[1].any()  # band 2 has no weights
+    assert list(model.template_len) == [50, 0]
+
+
+def test_compiled_model_is_immutable(tlcca_model):
+    with pytest.raises(AttributeError):
+        tlcca_model.Fs = 500
+    with pytest.raises(AttributeError):
+        del tlcca_model.Wx
+    with pytest.raises(ValueError):
+        tlcca_model.Wx[0, 0, 0] = 1.0
+
+
+def test_compiled_model_owns_its_arrays_and_table(tlcca_model):
+    Wx = np.array(tlcca_model.Wx)
+    table = dict(tlcca_model.char_table)
+    model = CompiledTLCCAModel(Wx, tlcca_model.Wy, tlcca_model.templates, tlcca_model.template_len,
+                               tlcca_model.r1a_mask, tlcca_model.r1b_mask, tlcca_model.r3_mask,
+                               tlcca_model.FB_coef, table, tlcca_model.num_of_harmonics, tlcca_model.Fs)
+    # The caller's arrays stay writable, and writing to them does not reach the model
+    Wx[0, 0, 0] += 1.0
+    table['domain'] = np.zeros(tlcca_model.num_classes)
+    np.testing.assert_array_equal(model.Wx, tlcca_model.Wx)
+    np.testing.assert_array_equal(model.char_table['domain'], tlcca_model.char_table['domain'])
+    with pytest.raises(TypeError):
+        model.char_table['domain'] = table['domain']
+    assert not any(array.flags.writeable for array in model.char_table.values())
@@ -0,0 +1,207 @@
+import hashlib
+
+import numpy as np
+import pytest
+from scipy import signal
+
+from tlcca_preprocessing import (FFTFilterBank, FilterDesignRegistry, FilteredBankCache, LinearOperatorFilterBank,
+                                 LineNoiseEstimator, TLCCAPreprocessor, design_notch_sos, design_subband_sos,
+                                 sosfiltfilt_padlen)
+
+FS = 250
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return FilterDesignRegistry(str(tmp_path / 'filter_designs.npz'))
+
+
+@pytest.fixture
+def window():
+    return np.random.default_rng(0).standard_normal((9, 200))
+
+
+def test_registry_designs_are_writable_copies(registry):
+    first = registry.subband(FS, 1)
+    assert first.flags.writeable
+    first[:] = 0
+    assert np.array_equal(registry.subband(FS, 1), design_subband_sos(FS, 1))
+
+
+@pytest.mark.parametrize('reload', [False, True])
+def test_registry_filtering_matches_fresh_designs(registry, window, reload):
+    if reload:
+        TLCCAPreprocessor(FS, 5, registry=registry)
+        registry = FilterDesignRegistry(registry.path)
+    pp = TLCCAPreprocessor(FS, 5, registry=registry)
+
+    notched = signal.sosfiltfilt(design_notch_sos(FS), window)
+    np.testing.assert_array_equal(pp.notch(window), notched)
+    for sub_band in range(1, 6):
+        expected = signal.sosfiltfilt(design_subband_sos(FS, sub_band), notched)
+        np.testing.assert_array_equal(pp.subband(notched, sub_band), expected)
+        assert not np.allclose(expected, notched)
+    if reload:
+        assert registry.hits == 6 and registry.designed == 0
+
+
+def test_short_input_is_returned_unfiltered(registry):
+    pp = TLCCAPreprocessor(FS, 5, registry=registry)
+    for sos, apply in [(pp.notch_sos, pp.notch)] + [(sos, lambda x, b=b: pp.subband(x, b))
+                                                      for b, sos in enumerate(pp.band_sos, start=1)]:
+        short = np.ones((9, sosfiltfilt_padlen(sos)))
+        assert apply(short) is short
+        longer = np.ones((9, sosfiltfilt_padlen(sos) + 1))
+        assert apply(longer) is not longer
+
+
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+def test_failed_design_raises(registry):
+    # At 150 Hz the sub-band stop edge (100 Hz) is above Nyquist: no silent substitute design
+    with pytest.raises(ValueError):
+        TLCCAPreprocessor(150, 5, registry=registry)
+
+
+def test_registry_writes_once_per_batch(registry, monkeypatch):
+    saves = []
+    original_save = registry._save
+    monkeypatch.setattr(registry, '_save', lambda: (saves.append(1), original_save()))
+    TLCCAPreprocessor(FS, 5, registry=registry)
+    assert registry.designed == 6 and len(saves) == 1
+    TLCCAPreprocessor(FS, 5, registry=registry)
+    assert len(saves) == 1
+
+
+def test_registry_rejects_entry_stored_under_another_spec(registry):
+    TLCCAPreprocessor(FS, 5, registry=registry)
+    # Intact bytes and digest, but sub-band 2 stored under the spec of sub-band 1
+    with np.load(registry.path) as data:
+        arrays = dict(data)
+    entry = registry._entry_name(registry.subband_spec(FS, 1))
+    wrong = np.ascontiguousarray(design_subband_sos(FS, 2))
+    arrays[entry + '_sos'] = wrong
+    arrays[entry + '_sha256'] = np.array(hashlib.sha256(wrong.tobytes()).hexdigest())
+    np.savez(registry.path, **arrays)
+
+    reloaded = FilterDesignRegistry(registry.path)
+    np.testing.assert_array_equal(reloaded.subband(FS, 1), design_subband_sos(FS, 1))
+    assert reloaded.rejected == 1 and reloaded.designed == 1
+    np.testing.assert_array_equal(reloaded.notch(FS), design_notch_sos(FS))
+    assert reloaded.rejected == 1 and reloaded.hits == 1
+
+
+@pytest.mark.parametrize('chunk', [1, 13, 250])
+def test_causal_bank_matches_whole_stream_sosfilt(registry, chunk):
+    pp = TLCCAPreprocessor(FS, 5, registry=registry)
+    stream = np.random.default_rng(1).standard_normal((9, 750))
+    bank = pp.causal_filter_bank(stream.shape[0])
+    filtered = np.concatenate([bank.process(stream[:, i:i + chunk]) for i in range(0, stream.shape[1], chunk)],
+                              axis=-1)
+
+    notched = signal.sosfilt(design_notch_sos(FS), stream)
+    for band in range(5):
+        np.testing.assert_allclose(filtered[band], signal.sosfilt(design_subband_sos(FS, band + 1), notched),
+                                   rtol=0, atol=1e-12)
+
+    bank.reset()
+    np.testing.assert_array_equal(bank.process(stream[:, :chunk]), filtered[..., :chunk])
+
+
+def _sosfiltfilt_bank(x):
+    notched = signal.sosfiltfilt(design_notch_sos(FS), x)
+    return np.stack([signal.sosfiltfilt(design_subband_sos(FS, band), notched) for band in range(1, 6)])
+
+
+@pytest.mark.parametrize('notch_in_mask', [False, True])
+def test_fft_bank_matches_sosfiltfilt_away_from_edges(registry, notch_in_mask):
+    pp = TLCCAPreprocessor(FS, 5, registry=registry)
+    x = np.random.default_rng(2).standard_normal((9, 2000))
+    expected = _sosfiltfilt_bank(x)
+    bank = FFTFilterBank(pp, notch_in_mask=notch_in_mask).filter_bank(x)
+    assert bank.shape == expected.shape
+    # |H|^2 masks are exact in steady state; only the edge transients differ
+    np.testing.assert_allclose(bank[..., 500:1500], expected[..., 500:1500], rtol=0,
+                               atol=1e-3 * np.abs(expected).max())
+    assert np.linalg.norm(bank - expected) < 0.05 * np.linalg.norm(expected)
+
+
+def test_fft_bank_passes_short_windows_through_like_sosfiltfilt(registry, window):
+    pp = TLCCAPreprocessor(FS, 5, registry=registry)
+    short = window[:, :8]
+    np.testing.assert_allclose(FFTFilterBank(pp).filter_bank(short), pp.filter_bank(short), rtol=0, atol=1e-12)
+    out = np.empty((5,) + window.shape)
+    assert FFTFilterBank(pp).filter_bank(window, out=out) is out
+
+
+@pytest.mark.parametrize('length', [100, 157, 200])
+def test_operator_bank_matches_sosfiltfilt(registry, length):
+    pp = TLCCAPreprocessor(FS, 5, registry=registry)
+    x = np.random.default_rng(3).standard_normal((2, 9, length))  # a batch of windows
+    bank = LinearOperatorFilterBank(pp, lengths=[100, 157, 200], precompute_lengths=[200])
+    np.testing.assert_allclose(bank.filter_bank(x), _sosfiltfilt_bank(x).transpose(1, 0, 2, 3), rtol=0, atol=1e-12)
+    assert not bank.operator(length).flags.writeable
+
+
+@pytest.mark.parametrize('mains', [(60,), (50, 60), ()])
+def test_notch_variant_banks_share_the_sub_band_operators(registry, mains):
+    default = LinearOperatorFilterBank(TLCCAPreprocessor(FS, 5, registry=registry), lengths=[157, 200])
+    pp = TLCCAPreprocessor(FS, 5, notch_freq=mains, registry=registry)
+    bank = LinearOperatorFilterBank(pp, lengths=[157, 200], bands_from=default)
+    other = LinearOperatorFilterBank(TLCCAPreprocessor(FS, 5, notch_freq=(60,), registry=registry), lengths=[157, 200],
+                                     bands_from=default)
+    x = np.random.default_rng(4).standard_normal((2, 9, 157))
+    np.testing.assert_allclose(bank.filter_bank(x), pp.filter_bank(x), rtol=0, atol=1e-12)
+    # One set of band operators per length; the variants only own a T x T notch operator (none without a notch)
+    assert bank.operator(157) is other.operator(157) is default.band_operator(157)
+    assert not bank._operators and not other._operators
+    assert (bank.notch_operator(157) is None) == (mains == ())
+    out = np.empty((2, 5, 9, 157))
+    assert bank.filter_bank(x, out=out) is out
+    assert bank.operator(120) is None
+
+
+def test_operator_bank_falls_back_outside_its_lengths(registry, window):
+    pp = TLCCAPreprocessor(FS, 5, registry=registry)
+    bank = LinearOperatorFilterBank(pp, lengths=[100])
+    assert bank.operator(window.shape[-1]) is None
+    out = np.empty((5,) + window.shape)
+    assert bank.filter_bank(window, out=out) is out
+    np.testing.assert_array_equal(out, pp.filter_bank(window))
+
+
+def test_filtered_bank_cache_is_a_frozen_lru():
+    cache = FilteredBankCache(max_entries=2)
+    banks = [np.zeros((5, 9, 10)) + i for i in range(3)]
+    cache.put(0, 10, banks[0])
+    cache.put(10, 20, banks[1])
+    assert cache.get(0, 10) is banks[0]  # now the most recent
+    cache.put(20, 30, banks[2])  # evicts [10, 20)
+    assert cache.get(10, 20) is None
+    assert cache.get(0, 10) is banks[0] and cache.get(20, 30) is banks[2]
+    assert not banks[0].flags.writeable
+    assert (cache.hits, cache.misses) == (3, 1)
+    cache.clear()
+    assert cache.get(0, 10) is None and (cache.hits, cache.misses) == (0, 1)
+
+
+def test_filtered_bank_cache_keeps_generations_apart():
+    cache = FilteredBankCache()
+    block, stream = np.zeros((5, 9, 10)), np.ones((5, 9, 10))
+    cache.put(0, 10, block, generation=('block', 1))
+    cache.put(0, 10, stream, generation=('stream', 4))
+    assert cache.get(0, 10, ('block', 1)) is block and cache.get(0, 10, ('stream', 4)) is stream
+    assert cache.get(0, 10, ('block', 2)) is None
+
+
+@pytest.mark.parametrize('chunk', [7, 250, 1000])
+def test_line_noise_estimator_selects_notches_per_channel(chunk):
+    t = np.arange(3 * FS) / FS
+    noise = 0.5 * np.random.default_rng(4).standard_normal((4, t.size))
+    stream = noise + np.array([[2.0, 0.0], [0.0, 2.0], [2.0, 2.0], [0.0, 0.0]]) @ np.stack(
+        [np.sin(2 * np.pi * 50 * t), np.sin(2 * np.pi * 60 * t + 1.0)])
+    estimator = LineNoiseEstimator(FS, 4)
+    assert estimator.select() is None
+    for i in range(0, t.size, chunk):
+        estimator.update(stream[:, i:i + chunk])
+    assert estimator.blocks == 3
+    assert estimator.select() == ((50,), (60,), (50, 60), ())
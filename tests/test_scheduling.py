@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from tlcca_scheduling import DecisionScheduler, ReplayClock, sleep_until
+
+FS = 250
+
+
+class FakeClock:
+    """Monotonic clock stand-in: sleep() advances it by exactly the requested time plus `overshoot`"""
+
+    def __init__(self, overshoot=0.0):
+        self.now = 100.0
+        self.overshoot = overshoot
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds + self.overshoot
+
+
+def _scheduler(duration=None, clock=None, num_chars=3):
+    clock = clock or FakeClock()
+    return DecisionScheduler(FS, 3.0, num_chars, recognition_start_offset=0.63, recognition_end_offset=2.5,
+                             window_samples=200, min_samples=160, stride_samples=5, duration=duration,
+                             clock=clock, sleep=clock.sleep)
+
+
+def test_decision_timeline():
+    decisions = list(_scheduler().decisions())
+    for char_idx in range(3):
+        recognition_start = int((char_idx * 3.0 + 0.63) * FS)
+        recognition_end = int((char_idx * 3.0 + 2.5) * FS)
+        ends = [d.end_sample for d in decisions if d.char_idx == char_idx]
+        # First decision once min_samples are in, then one per stride up to the flicker end
+        assert ends == list(range(recognition_start + 160, recognition_end + 1, 5))
+        for d in decisions:
+            if d.char_idx == char_idx:
+                assert d.start_sample == max(d.end_sample - 200, recognition_start)
+    assert len(decisions) == 3 * 62
+    assert [d.time for d in decisions] == [d.end_sample / FS for d in decisions]
+    assert np.all(np.diff([d.time for d in decisions]) > 0)
+
+
+def test_decision_timeline_stops_at_duration():
+    decisions = list(_scheduler(duration=4.5).decisions())
+    assert decisions[-1].time < 4.5
+    assert decisions == [d for d in _scheduler().decisions() if d.time < 4.5]
+    assert {d.char_idx for d in decisions} == {0, 1} and len(decisions) < 2 * 62
+
+
+@pytest.mark.parametrize('overshoot', [0.0, 0.002])
+def test_wait_sleeps_to_each_deadline_and_records_lateness(overshoot):
+    clock = FakeClock(overshoot)
+    scheduler = _scheduler(clock=clock, num_chars=1)
+    scheduler.start()
+    decisions = list(scheduler.decisions())[:5]
+    for decision in decisions:
+        scheduler.wait(decision)
+        assert clock.now - 100.0 == pytest.approx(decision.time + overshoot)
+    assert clock.sleeps[0] == pytest.approx(decisions[0].time)
+    assert scheduler.lateness == pytest.approx([overshoot] * 5)
+    summary = scheduler.lateness_summary()
+    assert summary['decisions'] == 5
+    assert summary['max_ms'] == pytest.approx(overshoot * 1000, abs=1e-6)
+
+
+def test_sleep_until_does_not_sleep_past_deadline():
+    clock = FakeClock()
+    assert sleep_until(clock.now - 0.01, clock, clock.sleep) == pytest.approx(0.01)
+    assert clock.sleeps == []
+    assert sleep_until(clock.now + 0.5, clock, clock.sleep) == pytest.approx(0.0)
+    assert clock.sleeps == [pytest.approx(0.5)]
+
+
+def test_unpaced_replay_clock_jumps_to_deadlines():
+    clock = FakeClock()
+    replay = ReplayClock(None, clock, clock.sleep)
+    scheduler = _scheduler(clock=replay, num_chars=1)
+    scheduler.start()
+    decisions = list(scheduler.decisions())
+    for decision in decisions:
+        scheduler.wait(decision)
+        assert replay() == pytest.approx(decision.time)
+    assert clock.sleeps == []  # no real time passes
+    assert max(scheduler.lateness) == pytest.approx(0.0, abs=1e-9)
+
+
+def test_fast_replay_clock_scales_real_time():
+    clock = FakeClock()
+    replay = ReplayClock(10.0, clock, clock.sleep)
+    replay.sleep(2.0)
+    assert clock.sleeps == [pytest.approx(0.2)]
+    assert replay() == pytest.approx(2.0)
+    with pytest.raises(ValueError):
+        ReplayClock(0)
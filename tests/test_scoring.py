@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from tlcca_scoring import (BatchedTLCCAScorer, ReferenceBank, ScoringWorkspace, SlidingWindowTLCCAScorer,
+                          compare_scorers, generate_reference_bank, regularized_canoncorr)
+
+
+def _abs_corr(a, b):
+    a, b = a - a.mean(), b - b.mean()
+    den = np.sqrt(a @ a * (b @ b))
+    return abs(a @ b) / den if den > 0 else 0.0
+
+
+def _matlab_canoncorr(X, Y):
+    """First canonical pair as the engines' matlab_canoncorr_exact computes it"""
+    X, Y = X - X.mean(axis=0), Y - Y.mean(axis=0)
+    n = X.shape[0]
+    Lx = np.linalg.cholesky(X.T @ X / (n - 1) + 1e-12 * np.eye(X.shape[1]))
+    Ly = np.linalg.cholesky(Y.T @ Y / (n - 1) + 1e-12 * np.eye(Y.shape[1]))
+    M = np.linalg.solve(Ly.T, np.linalg.solve(Lx, X.T @ Y / (n - 1)).T).T
+    U, s, Vt = np.linalg.svd(M, full_matrices=False)
+    return np.linalg.solve(Lx.T, U[:, 0]), np.linalg.solve(Ly.T, Vt[0, :])
+
+
+def _reference_scores(model, bank):
+    """Per-class TLCCA scores written out directly from r1a, r1b and the canoncorr r3"""
+    T = bank.shape[-1]
+    table = model.char_table
+    refs = generate_reference_bank(table['freq'], table['phase'], T, model.num_of_harmonics, model.Fs)
+    scores = np.zeros(model.num_classes)
+    for c in range(model.num_classes):
+        for b in range(model.num_of_subbands):
+            p = model.Wx[b, :, c] @ bank[b]
+            r1a = _abs_corr(p, model.Wy[b, :, c] @ refs[c]) if model.r1a_mask[b, c] else 0.0
+            template_len = min(int(model.template_len[b]), T)
+            r1b = (_abs_corr(p[:template_len], model.templates[b, :template_len, c])
+                   if model.r1b_mask[b, c] and template_len > 10 else 0.0)
+            A, B = _matlab_canoncorr(p[:, None], refs[c].T)
+            r3 = _abs_corr(p * A[0], refs[c].T @ B) if model.r3_mask[b, c] else 0.0
+            scores[c] += model.FB_coef[b] * (r1a**2 + r1b**2 + r3**2)
+    return scores
+
+
+@pytest.fixture
+def banks(tlcca_model):
+    return np.random.default_rng(0).standard_normal((3, tlcca_model.num_of_subbands, 9, 200))
+
+
+def test_batched_scores_match_per_class_reference(tlcca_model, banks):
+    scorer = BatchedTLCCAScorer(tlcca_model)
+    scores = scorer.score_batch(banks)
+    assert scores.shape == (3, 40)
+    for bank, row in zip(banks, scores):
+        np.testing.assert_allclose(row, _reference_scores(tlcca_model, bank), rtol=1e-9, atol=1e-12)
+        np.testing.assert_array_equal(scorer.score(bank), row)
+
+
+def test_batched_scorer_returns_zeros_for_a_channel_mismatch(tlcca_model, banks):
+    assert not BatchedTLCCAScorer(tlcca_model).score_batch(banks[:, :, :8]).any()
+
+
+def test_reference_bank_serves_prefixes_and_longer_windows():
+    freqs, phases = np.array([8.0, 9.4, 15.2]), np.array([0.0, 0.5, 1.0]) * np.pi
+    bank = ReferenceBank(freqs, phases, 5, 250, max_len=300, precompute_lengths=[200])
+    for length in (75, 200, 300, 400):
+        np.testing.assert_array_equal(bank.references(length), generate_reference_bank(freqs, phases, length, 5, 250))
+    assert np.shares_memory(bank.references(200), bank.refs)
+    assert bank.cca_basis(200) is bank.cca_basis(200)
+    assert not bank.references(200).flags.writeable
+
+
+def test_float32_scorer_tracks_float64(tlcca_model, banks):
+    scorer32 = BatchedTLCCAScorer(tlcca_model, dtype=np.float32)
+    assert scorer32.score_batch(banks).dtype == np.float32
+    parity = compare_scorers(BatchedTLCCAScorer(tlcca_model), scorer32, banks)
+    assert parity['windows'] == 3
+    assert parity['max_score_deviation'] < 1e-5
+    assert parity['argmax_disagreements'] == 0
+    assert tlcca_model.Wx.dtype == np.float64  # the shared model is not cast
+
+
+def test_sliding_scorer_matches_batched_scores(tlcca_model):
+    scorer = BatchedTLCCAScorer(tlcca_model)
+    sliding = SlidingWindowTLCCAScorer(scorer, capacity=201)
+    stream = np.random.default_rng(1).standard_normal((tlcca_model.num_of_subbands, 9, 1200))
+    checked = 0
+    for end in range(5, stream.shape[-1] + 1, 5):  # well past capacity: retire and refresh run
+        sliding.push(stream[..., end - 5:end])
+        if end % 35 == 0:
+            start = max(0, end - 200)
+            np.testing.assert_allclose(sliding.score_window(start, end), scorer.score(stream[..., start:end]),
+                                       rtol=1e-8, atol=1e-10)
+            checked += 1
+    assert checked == 34
+    assert sliding.score_window(1000, 1195) is None  # not at the newest sample
+    assert sliding.score_window(900, 1200) is None  # older than the capacity
+
+
+def test_regularized_canoncorr_finds_the_first_canonical_pair():
+    rng = np.random.default_rng(2)
+    X = rng.standard_normal((200, 3))
+    Y = np.column_stack([X @ [1.0, -2.0, 0.5], rng.standard_normal((200, 4))]) + 0.5 * rng.standard_normal((200, 5))
+    A, B = regularized_canoncorr(X, Y)
+    # First canonical correlation: top singular value of the product of orthonormal bases
+    Qx, Qy = np.linalg.qr(X - X.mean(axis=0))[0], np.linalg.qr(Y - Y.mean(axis=0))[0]
+    expected = np.linalg.svd(Qx.T @ Qy, compute_uv=False)[0]
+    assert _abs_corr(X @ A, Y @ B) == pytest.approx(expected, rel=1e-9)
+    assert A[np.argmax(np.abs(A))] > 0
+
+
+def test_regularized_canoncorr_is_finite_on_degenerate_input():
+    X = np.column_stack([np.arange(50.0), np.arange(50.0)])  # rank deficient
+    for Y in (np.ones((50, 2)), np.random.default_rng(3).standard_normal(50)):
+        A, B = regularized_canoncorr(X, Y)
+        assert np.all(np.isfinite(A)) and np.all(np.isfinite(B))
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_workspace_scoring_matches_and_stops_allocating(tlcca_model, dtype):
+    scorer = BatchedTLCCAScorer(tlcca_model, dtype=dtype)
+    workspace = scorer.reserve_workspace(ScoringWorkspace(dtype), channels=9, max_len=300)
+    reserved = workspace.allocations
+    for length in (300, 200, 157, 200):
+        bank = np.random.default_rng(length).standard_normal((tlcca_model.num_of_subbands, 9, length))
+        np.testing.assert_allclose(scorer.score(bank, workspace=workspace), scorer.score(bank),
+                                   rtol=1e-5 if dtype == np.float32 else 1e-12, atol=1e-7)
+    assert workspace.allocations == reserved
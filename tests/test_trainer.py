@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from extract_block import FixedTLCCATrainer
+
+
+def _per_trial_ssvep(trainer, eeg_data, training_blocks, d1, d3):
+    """SSVEPdata per sub-band as the per-trial loop built it: one notch and one filter call per trial"""
+    Fs, latency = trainer.Fs, trainer.latencyDelay
+    ssvep = {}
+    for sub_band in range(1, trainer.num_of_subbands + 1):
+        ssvep[sub_band] = np.zeros((d3, 2 * Fs, len(training_blocks), d1))
+        for i in range(d1):
+            for j_enum, j in enumerate(training_blocks):
+                y = trainer.preprocessor.notch(eeg_data[:, :, i, j - 1].T).T
+                filtered = trainer.preprocessor.subband(y, sub_band)[:, latency:latency + 2 * Fs]
+                ssvep[sub_band][:, :filtered.shape[1], j_enum, i] = filtered
+    return ssvep
+
+
+@pytest.mark.parametrize('samples', [750, 400])  # 400: shorter than the latency-cut 2 s segment
+def test_vectorized_preprocessing_matches_per_trial_loop(tmp_path, samples):
+    trainer = FixedTLCCATrainer(str(tmp_path))
+    d1, d3, blocks = 6, 9, 4
+    eeg_data = np.random.default_rng(0).standard_normal((d3, samples, d1, blocks))
+    training_blocks = [1, 3, 4]
+
+    trainer._preprocess_data_beta(eeg_data, training_blocks, d1, blocks, d3, samples)
+    expected = _per_trial_ssvep(trainer, eeg_data, training_blocks, d1, d3)
+    for sub_band in range(1, trainer.num_of_subbands + 1):
+        np.testing.assert_array_equal(trainer.subband_signal[sub_band]['SSVEPdata'], expected[sub_band])
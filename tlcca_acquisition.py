@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TLCCA acquisition front-end - stages between the amplifier stream and the recognition buffer
+"""
+
+import itertools
+import queue
+import threading
+import time
+from fractions import Fraction
+
+import numpy as np
+from scipy import signal
+
+_stream_epochs = itertools.count(1)
+
+
+class PolyphaseResampler:
+    """Chunk-by-chunk rational resampling (anti-aliased polyphase FIR) with carried input state
+
+    Uses the resample_poly design (Kaiser-windowed firwin, cut-off at the lower Nyquist,
+    10 * max(up, down) taps per side), so the concatenated output of any chunking equals
+    signal.resample_poly of the whole stream. Output sample n is aligned to input time
+    n / output_rate; it is emitted once the filter's support has arrived, i.e. with a
+    fixed lag of half_len / up input samples. flush() emits the tail at end of stream.
+    """
+
+    def __init__(self, input_rate, output_rate, channels, window=('kaiser', 5.0)):
+        ratio = Fraction(output_rate).limit_denominator(10000) / Fraction(input_rate).limit_denominator(10000)
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.channels = channels
+        self.up, self.down = ratio.numerator, ratio.denominator
+
+        max_rate = max(self.up, self.down)
+        if max_rate == 1:
+            self.half_len, h = 0, np.ones(1)  # same rate: pass-through
+        else:
+            self.half_len = 10 * max_rate
+            h = signal.firwin(2 * self.half_len + 1, 1.0 / max_rate, window=window) * self.up
+        # Polyphase split: phase p holds h[p], h[p + up], ... ; padded to equal length
+        self.taps_per_phase = -(-len(h) // self.up)
+        h = np.concatenate([h, np.zeros(self.taps_per_phase * self.up - len(h))])
+        self._phases = h.reshape(self.taps_per_phase, self.up).T[:, ::-1].copy()  # reversed for a dot with history
+        self.reset()
+
+    @property
+    def lag_samples(self):
+        """Input samples an output waits for beyond its own timestamp"""
+        return self.half_len / self.up
+
+    def reset(self):
+        """Empty state (start of a new stream)"""
+        self._history = np.zeros((self.channels, self.taps_per_phase - 1))  # zero padding before the stream
+        self._history_start = -(self.taps_per_phase - 1)  # absolute input index of _history[:, 0]
+        self.samples_in = 0
+        self.samples_out = 0
+
+    def process(self, chunk):
+        """Resample the next (channels, k) input samples -> (channels, m) output samples"""
+        chunk = np.asarray(chunk, dtype=float)
+        self._history = np.concatenate([self._history, chunk], axis=1)
+        self.samples_in += chunk.shape[1]
+        return self._emit(self.samples_in - 1)
+
+    def flush(self):
+        """Emit the remaining outputs of the stream (zero padding after its end), then reset"""
+        total = -(-self.samples_in * self.up // self.down)
+        pad = max(0, (total - 1) * self.down + self.half_len) // self.up + 1 - self.samples_in
+        self._history = np.concatenate([self._history, np.zeros((self.channels, max(pad, 0)))], axis=1)
+        out = self._emit(self._history_start + self._history.shape[1] - 1, limit=total)
+        self.reset()
+        return out
+
+    def _emit(self, last_input, limit=None):
+        # Output n needs upsampled position m = n*down + half_len, i.e. input m // up and taps_per_phase - 1 before it
+        last_output = ((last_input + 1) * self.up - 1 - self.half_len) // self.down
+        if limit is not None:
+            last_output = min(last_output, limit - 1)
+        n = np.arange(self.samples_out, last_output + 1)
+        if len(n) == 0:
+            out = np.zeros((self.channels, 0))
+        else:
+            m = n * self.down + self.half_len
+            phase, newest = m % self.up, m // self.up - self._history_start
+            idx = newest[:, None] - np.arange(self.taps_per_phase - 1, -1, -1)[None, :]
+            # (channels, outputs, taps) . (outputs, taps)
+            out = np.einsum('cnt,nt->cn', self._history[:, idx], self._phases[phase])
+            self.samples_out = int(n[-1]) + 1
+
+        # Keep only what the next output can still reach
+        next_m = self.samples_out * self.down + self.half_len
+        keep_from = next_m // self.up - (self.taps_per_phase - 1) - self._history_start
+        if keep_from > 0:
+            self._history = self._history[:, keep_from:]
+            self._history_start += keep_from
+        return out
+
+
+class SampleRingBuffer:
+    """Fixed-capacity channel-major ring buffer addressed by absolute sample index
+
+    Holds the newest `capacity` samples of a (*lead, samples) stream, e.g. (channels,) or
+    (subbands, channels). append() is one slice copy (two when the chunk wraps around the
+    end). window(start, end) returns a zero-copy view when the range does not wrap and a
+    copy (into out, if given) when it does; samples older than `start` are gone.
+    buffer[:, a:b] works like slicing the old growing array with absolute indices.
+    epoch is unique per buffer and per reset(), so caches keyed by sample index can tell
+    streams apart.
+    """
+
+    def __init__(self, lead_shape, capacity, dtype=np.float64):
+        self.lead_shape = tuple(int(n) for n in np.atleast_1d(lead_shape))
+        self.capacity = int(capacity)
+        self._data = np.zeros(self.lead_shape + (self.capacity,), dtype=dtype)
+        self.total = 0  # absolute index one past the newest sample
+        self.epoch = next(_stream_epochs)
+
+    @property
+    def start(self):
+        """Absolute index of the oldest sample still held"""
+        return max(0, self.total - self.capacity)
+
+    @property
+    def shape(self):
+        """(*lead, total) - the shape of the full history this buffer stands in for"""
+        return self.lead_shape + (self.total,)
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
+
+    def reset(self):
+        """Empty the buffer (start of a new stream)"""
+        self.total = 0
+        self.epoch = next(_stream_epochs)
+
+    def append(self, chunk):
+        """Append (*lead, k) samples"""
+        k = chunk.shape[-1]
+        if k > self.capacity:
+            self.total += k - self.capacity
+            chunk = chunk[..., k - self.capacity:]
+            k = self.capacity
+        pos = self.total % self.capacity
+        first = min(k, self.capacity - pos)
+        self._data[..., pos:pos + first] = chunk[..., :first]
+        if first < k:
+            self._data[..., :k - first] = chunk[..., first:]
+        self.total += k
+
+    def window(self, start, end, out=None):
+        """Samples [start, end) as (*lead, end - start), or None if not (or no longer) held"""
+        if start < self.start or end > self.total or start > end:
+            return None
+        a = start % self.capacity
+        b = a + (end - start)
+        if b <= self.capacity:
+            if out is None:
+                return self._data[..., a:b]
+            np.copyto(out, self._data[..., a:b])
+            return out
+        if out is None:
+            out = np.empty(self.lead_shape + (end - start,), dtype=self._data.dtype)
+        split = self.capacity - a
+        out[..., :split] = self._data[..., a:]
+        out[..., split:] = self._data[..., :b - self.capacity]
+        return out
+
+    def __getitem__(self, key):
+        # Only buffer[:, ..., a:b] (full leading slices, absolute time slice) is supported
+        if not isinstance(key, tuple) or len(key) != len(self.lead_shape) + 1 or any(
+                k != slice(None) for k in key[:-1]) or not isinstance(key[-1], slice) or key[-1].step not in (None, 1):
+            raise TypeError("SampleRingBuffer supports only [:, ..., start:end] indexing")
+        start = 0 if key[-1].start is None else key[-1].start
+        end = self.total if key[-1].stop is None else min(key[-1].stop, self.total)
+        window = self.window(start, max(start, end))
+        if window is None:
+            raise IndexError(f"samples [{start}, {end}) are no longer held (oldest {self.start}, newest {self.total})")
+        return window
+
+
+def _latency_summary(seconds):
+    """count / mean / p95 / max in ms of a list of durations (s)"""
+    if not seconds:
+        return {'count': 0}
+    ms = np.asarray(seconds) * 1000
+    return {'count': len(ms), 'mean_ms': float(np.mean(ms)), 'p95_ms': float(np.percentile(ms, 95)),
+            'max_ms': float(np.max(ms))}
+
+
+class ReplaySource:
+    """Recorded (channels, samples) block as an acquisition device
+
+    read() returns the next (first_sample, chunk) of chunk_samples, or None at the end of
+    the recording. With a clock each chunk is released when its last sample is due (block
+    time 0 = start()); without one the recording is read as fast as it is consumed.
+    A device adapter only has to provide the same start() / read() pair.
+    """
+
+    def __init__(self, data, Fs, chunk_samples, first_sample=0, clock=None, sleep=time.sleep):
+        self.data = data
+        self.Fs = Fs
+        self.chunk_samples = max(1, int(chunk_samples))
+        self.position = int(first_sample)
+        self.clock = clock
+        self.sleep = sleep
+        self.origin = 0.0
+
+    @property
+    def paced(self):
+        """True if chunks are released on the clock, like a device; False if read as fast as consumed"""
+        return self.clock is not None
+
+    def start(self):
+        """Anchor block time 0 at the current clock reading"""
+        if self.clock is not None:
+            self.origin = self.clock()
+
+    def read(self):
+        """Next (first_sample, chunk) - a view into the recording - or None when it is exhausted"""
+        total = self.data.shape[-1]
+        if self.position >= total:
+            return None
+        first, end = self.position, min(self.position + self.chunk_samples, total)
+        if self.clock is not None:
+            remaining = self.origin + end / self.Fs - self.clock()
+            if remaining > 0:
+                self.sleep(remaining)
+        self.position = end
+        return first, self.data[..., first:end]
+
+
+class AcquisitionPipeline:
+    """Acquisition thread -> bounded queue -> buffering thread, read by a scoring worker
+
+    The acquisition thread reads chunks from `source` and puts them on a bounded queue.
+    When the queue is full it waits (backpressure: the source, e.g. a replay, slows down)
+    or, with drop_when_full, drops the chunk and counts it. Dropping needs a paced source
+    (source.paced): an unpaced replay outruns any scorer and would lose most of the block,
+    so that combination is rejected. The buffering stage fills a drop with zeros so
+    absolute sample indices stay aligned and records the range; window_has_gap() tells
+    the scorer which windows contain lost samples.
+
+    The buffering thread hands every chunk to buffer_stage(chunk) -> samples written
+    (ring buffer, resampling front-end) as soon as it arrives, independent of the scorer.
+    It only holds back when the ring is full: with a capacity it never writes past
+    keep_from + capacity, keep_from being the oldest sample the scorer still reads, as
+    announced by wait_for(end_sample, keep_from). Written samples are counted at
+    output_rate, source chunks at source.Fs. Queue depth, drops, gaps and per-stage
+    latency are available from stats().
+    """
+
+    def __init__(self, source, buffer_stage, queue_size=50, drop_when_full=False, first_sample=0,
+                 capacity=None, output_rate=None, poll_interval=0.05):
+        if drop_when_full and not getattr(source, 'paced', True):
+            raise ValueError("drop_when_full needs a paced source - an unpaced replay would outrun the scorer "
+                             "and drop most of the block; use backpressure instead")
+        self.source = source
+        self.buffer_stage = buffer_stage
+        self.queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.drop_when_full = drop_when_full
+        self.capacity = None if capacity is None else int(capacity)
+        self.ratio = 1.0 if output_rate is None else output_rate / source.Fs
+        self.poll_interval = poll_interval
+        self.buffered = int(first_sample)  # absolute index one past the newest written sample (output rate)
+        self.keep_from = int(first_sample)  # oldest sample the scorer still reads (output rate)
+        self.next_source_sample = int(round(first_sample / self.ratio))  # next expected chunk start (source rate)
+        self.finished = False
+        self.error = None
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._threads = []
+
+        self.chunks_in = 0
+        self.dropped_chunks = 0
+        self.dropped_samples = 0
+        self.max_queue_depth = 0
+        self.gaps = []  # zero-filled [start, end) ranges (output rate)
+        self.queue_latency = []  # put -> get
+        self.buffer_latency = []  # buffer_stage per chunk
+        self.scoring_latency = []  # reported by the scoring worker (record_scoring)
+
+    def start(self):
+        """Start the acquisition and buffering threads"""
+        self.source.start()
+        self._threads = [threading.Thread(target=self._acquire, name='tlcca-acquisition', daemon=True),
+                         threading.Thread(target=self._buffer, name='tlcca-buffering', daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stop both threads (pending chunks are discarded)"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def wait_for(self, end_sample, keep_from=None):
+        """Scoring worker: block until samples up to end_sample are written; False if the stream ended first
+
+        keep_from releases ring space: samples before it may be overwritten from now on.
+        """
+        with self._cond:
+            if keep_from is not None and keep_from > self.keep_from:
+                self.keep_from = keep_from
+                self._cond.notify_all()
+            while self.buffered < end_sample and not self.finished and not self._stopping:
+                self._cond.wait()
+            if self.error is not None:
+                raise self.error
+            return self.buffered >= end_sample
+
+    def window_has_gap(self, start, end):
+        """True if [start, end) overlaps zero-filled (dropped) samples"""
+        with self._cond:
+            return any(a < end and start < b for a, b in self.gaps)
+
+    def record_scoring(self, seconds):
+        """Scoring worker: report the duration of one decision"""
+        self.scoring_latency.append(seconds)
+
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def stats(self):
+        """Queue depth, drops, gaps and per-stage latency (ms)"""
+        return {
+            'chunks': self.chunks_in,
+            'queue_depth': self.queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'queue_size': self.queue.maxsize,
+            'dropped_chunks': self.dropped_chunks,
+            'dropped_samples': self.dropped_samples,
+            'gaps': len(self.gaps),
+            'gap_samples': sum(b - a for a, b in self.gaps),
+            'queue_latency': _latency_summary(self.queue_latency),
+            'buffer_latency': _latency_summary(self.buffer_latency),
+            'scoring_latency': _latency_summary(self.scoring_latency),
+        }
+
+    def _put(self, item):
+        # Returns False if the pipeline stopped while waiting for room
+        while not self._stopping:
+            try:
+                self.queue.put(item, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _acquire(self):
+        try:
+            while not self._stopping:
+                item = self.source.read()
+                if item is None:
+                    break
+                self.chunks_in += 1
+                item = (item[0], item[1], time.perf_counter())
+                if self.drop_when_full:
+                    try:
+                        self.queue.put_nowait(item)
+                    except queue.Full:
+                        self.dropped_chunks += 1
+                        self.dropped_samples += item[1].shape[-1]
+                        continue
+                elif not self._put(item):
+                    break
+                self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        finally:
+            self._put(None)  # end of stream
+
+    def _room(self, k):
+        # Source samples of a k-sample chunk that fit in the ring: a chunk of n yields at most ceil(n * ratio) + 1
+        if self.capacity is None:
+            return k
+        free = self.keep_from + self.capacity - self.buffered
+        return max(0, min(k, int((free - 1) / self.ratio)))
+
+    def _write(self, chunk, gap=False):
+        while chunk.shape[-1] and not self._stopping:
+            with self._cond:
+                take = self._room(chunk.shape[-1])
+                while not take and not self._stopping:  # ring full: wait for the scorer to release samples
+                    self._cond.wait()
+                    take = self._room(chunk.shape[-1])
+            if not take:
+                return
+            start = time.perf_counter()
+            written = int(self.buffer_stage(chunk[..., :take]))
+            self.buffer_latency.append(time.perf_counter() - start)
+            chunk = chunk[..., take:]
+            with self._cond:
+                if gap and written:
+                    if self.gaps and self.gaps[-1][1] == self.buffered:
+                        self.gaps[-1] = (self.gaps[-1][0], self.buffered + written)
+                    else:
+                        self.gaps.append((self.buffered, self.buffered + written))
+                self.buffered += written
+                self._cond.notify_all()
+
+    def _buffer(self):
+        try:
+            while not self._stopping:
+                try:
+                    item = self.queue.get(timeout=self.poll_interval)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    break
+                first, chunk, put_time = item
+                self.queue_latency.append(time.perf_counter() - put_time)
+                if first > self.next_source_sample:  # dropped chunks: keep the absolute index aligned
+                    self._write(np.zeros(chunk.shape[:-1] + (first - self.next_source_sample,), dtype=chunk.dtype),
+                                gap=True)
+                self.next_source_sample = first + chunk.shape[-1]
+                self._write(chunk)
+        except Exception as e:  # surfaced to the scoring worker by wait_for
+            self.error = e
+        finally:
+            with self._cond:
+                self.finished = True
+                self._cond.notify_all()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TLCCA model tables - character-to-domain mapping compiled once at model load
+"""
+
+from types import MappingProxyType
+
+import numpy as np
+
+# Domain flags of the character table
+NO_DOMAIN = -1
+SOURCE_DOMAIN = 0
+TARGET_DOMAIN = 1
+
+
+def compile_char_table(target_order, sti_f, pha_val, source_freq_idx, target_freq_idx, num_classes=40):
+    """Dense character table - replaces the per-score scans over target_order / *_freq_idx
+
+    Per character index:  reordered_pos, domain, column (into Wx_source/Wy_source or
+    Wx_transfer/templates_transfer), freq, phase.
+    Per reordered position: pos_domain, pos_column (for callers that work in reordered order).
+    """
+    num_positions = len(target_order)
+
+    pos_domain = np.full(num_positions, NO_DOMAIN, dtype=np.int8)
+    pos_column = np.full(num_positions, -1, dtype=np.int64)
+    # Target domain first so a position listed in both keeps the source mapping, as in the scan
+    for column, pos in enumerate(target_freq_idx):
+        if 0 <= pos < num_positions and pos_domain[pos] == NO_DOMAIN:
+            pos_domain[pos] = TARGET_DOMAIN
+            pos_column[pos] = column
+    for column, pos in enumerate(source_freq_idx):
+        if 0 <= pos < num_positions and pos_domain[pos] != SOURCE_DOMAIN:
+            pos_domain[pos] = SOURCE_DOMAIN
+            pos_column[pos] = column
+
+    reordered_pos = np.full(num_classes, -1, dtype=np.int64)
+    for pos in range(num_positions - 1, -1, -1):  # first occurrence wins
+        char_idx = int(target_order[pos])
+        if 0 <= char_idx < num_classes:
+            reordered_pos[char_idx] = pos
+
+    valid = reordered_pos >= 0
+    safe_pos = np.where(valid, reordered_pos, 0)
+    table = {
+        'reordered_pos': reordered_pos,
+        'domain': np.where(valid, pos_domain[safe_pos], NO_DOMAIN).astype(np.int8),
+        'column': np.where(valid, pos_column[safe_pos], -1),
+        'freq': np.where(valid, np.asarray(sti_f, dtype=float)[safe_pos], 0.0),
+        'phase': np.where(valid, np.asarray(pha_val, dtype=float)[safe_pos], 0.0),
+        'pos_domain': pos_domain,
+        'pos_column': pos_column,
+    }
+    for array in table.values():
+        array.flags.writeable = False
+    return table
+
+
+def _frozen_copy(array):
+    """Contiguous read-only copy owned by the model - the caller's array stays writable and unshared"""
+    array = np.array(array, order='C')
+    array.flags.writeable = False
+    return array
+
+
+class CompiledTLCCAModel:
+    """Immutable in-memory TLCCA model - contiguous per-band arrays indexed by character
+
+    Wx[band, ch, class], Wy[band, 2H, class], templates[band, T, class] hold, for every
+    character, the source-domain (Wx_source/Wy_source) or transfer (Wx_transfer/
+    templates_transfer) column; r1a/r1b/r3_mask[band, class] mark which components exist.
+    The model owns read-only copies of its arrays and a read-only view of its char_table,
+    so one instance can be shared between the recognition thread and the GUI loop without copies.
+    """
+
+    __slots__ = ('Wx', 'Wy', 'templates', 'template_len', 'r1a_mask', 'r1b_mask', 'r3_mask',
+                 'FB_coef', 'char_table', 'num_of_subbands', 'num_of_harmonics', 'num_classes', 'Fs')
+
+    def __init__(self, Wx, Wy, templates, template_len, r1a_mask, r1b_mask, r3_mask,
+                 FB_coef, char_table, num_of_harmonics, Fs):
+        fields = {
+            'Wx': Wx, 'Wy': Wy, 'templates': templates, 'template_len': template_len,
+            'r1a_mask': r1a_mask, 'r1b_mask': r1b_mask, 'r3_mask': r3_mask,
+            'FB_coef': np.asarray(FB_coef, dtype=float),
+        }
+        for name, value in fields.items():
+            if isinstance(value, np.ndarray):
+                value = _frozen_copy(value)
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, 'char_table', MappingProxyType({key: _frozen_copy(value)
+                                                                 for key, value in char_table.items()}))
+        object.__setattr__(self, 'num_of_subbands', Wx.shape[0])
+        object.__setattr__(self, 'num_of_harmonics', num_of_harmonics)
+        object.__setattr__(self, 'num_classes', Wx.shape[2])
+        object.__setattr__(self, 'Fs', Fs)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompiledTLCCAModel is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("CompiledTLCCAModel is immutable")
+
+    @classmethod
+    def from_weights(cls, online_weights, online_templates, char_table, FB_coef, num_of_harmonics, Fs):
+        """Compile from the per-band dicts as saved by extract_block.py (Wx_source_band1, ...)"""
+        num_of_subbands = len(FB_coef)
+        num_classes = len(char_table['domain'])
+        source_col = np.where(char_table['domain'] == SOURCE_DOMAIN, char_table['column'], -1)
+        target_col = np.where(char_table['domain'] == TARGET_DOMAIN, char_table['column'], -1)
+
+        band_weights = []
+        for sub_band in range(1, num_of_subbands + 1):
+            band_weights.append((online_weights.get(f'Wx_source_band{sub_band}'),
+                                 online_weights.get(f'Wy_source_band{sub_band}'),
+                                 online_weights.get(f'Wx_transfer_band{sub_band}'),
+                                 online_templates.get(f'templates_transfer_band{sub_band}')))
+
+        channels = next((w.shape[0] for band in band_weights for w in (band[0], band[2]) if w is not None), 0)
+        max_template_len = max((band[3].shape[0] for band in band_weights if band[3] is not None), default=0)
+
+        Wx = np.zeros((num_of_subbands, channels, num_classes))
+        Wy = np.zeros((num_of_subbands, 2 * num_of_harmonics, num_classes))
+        templates = np.zeros((num_of_subbands, max_template_len, num_classes))
+        template_len = np.zeros(num_of_subbands, dtype=np.int64)
+        r1a_mask = np.zeros((num_of_subbands, num_classes), dtype=bool)
+        r1b_mask = np.zeros((num_of_subbands, num_classes), dtype=bool)
+        r3_mask = np.zeros((num_of_subbands, num_classes), dtype=bool)
+
+        for b, (wx_source, wy_source, wx_transfer, H) in enumerate(band_weights):
+            if H is not None:
+                template_len[b] = H.shape[0]
+            for char_idx in range(num_classes):
+                s, t = source_col[char_idx], target_col[char_idx]
+                if s >= 0 and wx_source is not None and s < wx_source.shape[1]:
+                    if wx_source.shape[0] != channels:
+                        continue
+                    Wx[b, :, char_idx] = wx_source[:, s]
+                    r3_mask[b, char_idx] = np.any(wx_source[:, s] != 0)
+                    if wy_source is not None and s < wy_source.shape[1]:
+                        Wy[b, :, char_idx] = wy_source[:, s]
+                        r1a_mask[b, char_idx] = r3_mask[b, char_idx] and np.any(wy_source[:, s] != 0)
+                elif t >= 0 and wx_transfer is not None and t < wx_transfer.shape[1]:
+                    if wx_transfer.shape[0] != channels:
+                        continue
+                    Wx[b, :, char_idx] = wx_transfer[:, t]
+                    r3_mask[b, char_idx] = np.any(wx_transfer[:, t] != 0)
+                    if H is not None and t < H.shape[1]:
+                        templates[b, :H.shape[0], char_idx] = H[:, t]
+                        r1b_mask[b, char_idx] = r3_mask[b, char_idx] and np.any(H[:, t] != 0)
+
+        return cls(Wx, Wy, templates, template_len, r1a_mask, r1b_mask, r3_mask,
+                   FB_coef, char_table, num_of_harmonics, Fs)
+
+    def summary(self):
+        """Short description for logs"""
+        return (f"CompiledTLCCAModel: {self.num_classes} classes, {self.num_of_subbands} sub-bands, "
+                f"{self.Wx.shape[1]} channels, template length {int(self.templates.shape[1])}, "
+                f"Fs {self.Fs}Hz")
+
+
+def format_char_table(table, chars, weights_ok=None):
+    """One line per character - for auditing the mapping after model load"""
+    domain_names = {SOURCE_DOMAIN: 'source', TARGET_DOMAIN: 'target', NO_DOMAIN: '-'}
+    lines = []
+    for char_idx, char in enumerate(chars[:len(table['reordered_pos'])]):
+        lines.append(f"  '{char}' idx{char_idx:2d} -> pos{table['reordered_pos'][char_idx]:3d} | "
+                     f"{domain_names[int(table['domain'][char_idx])]:6s} col{table['column'][char_idx]:3d} | "
+                     f"{table['freq'][char_idx]:5.1f}Hz | phase {table['phase'][char_idx]:.3f}"
+                     + ("" if weights_ok is None else f" | weights {'✅' if weights_ok[char_idx] else '❌'}"))
+    return "\n".join(lines)
@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TLCCA preprocessing stage - notch + sub-band filter designs and their application,
+shared by the trainer and the recognition engines
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy import fft, signal
+
+
+def subband_edges(sub_band):
+    """Pass and stop edges (Hz) of sub-band k: pass [8k, 90], stop [8k-2, 100]"""
+    return (8 * sub_band, 90), (8 * sub_band - 2, 100)
+
+
+def design_notch_sos(Fs, notch_freq=50, Q=35):
+    """Comb notch at notch_freq and its harmonics below Nyquist - one iirnotch section each"""
+    M = int(np.floor((Fs / 2) / notch_freq))
+    return np.array([np.concatenate(signal.iirnotch((k * notch_freq) / (Fs / 2), Q)) for k in range(1, M + 1)])
+
+
+def design_subband_sos(Fs, sub_band, ripple=0.5, gpass=3, gstop=40):
+    """Chebyshev type I band-pass of sub-band k: pass [8k, 90] Hz, stop [8k-2, 100] Hz"""
+    passband, stopband = subband_edges(sub_band)
+    Wp = np.array(passband) / (Fs / 2)
+    Ws = np.array(stopband) / (Fs / 2)
+    N, Wn = signal.cheb1ord(Wp, Ws, gpass, gstop)
+    return signal.cheby1(N, ripple, Wn, btype='band', output='sos')
+
+
+def _notch_meets_spec(sos, Fs, notch_freq=50, Q=35):
+    """Section k is the iirnotch of harmonic k: null at k*f0 and pole radius set by the width k*f0/Q"""
+    harmonics = notch_freq * np.arange(1, int(np.floor((Fs / 2) / notch_freq)) + 1)
+    if len(sos) != len(harmonics):
+        return False
+    w0 = harmonics / (Fs / 2)
+    gain = 1.0 / (1.0 + np.tan(w0 / Q * np.pi / 2))
+    expected = np.column_stack([gain, -2 * gain * np.cos(np.pi * w0), gain,
+                                np.ones_like(gain), -2 * gain * np.cos(np.pi * w0), 2 * gain - 1])
+    return np.allclose(sos, expected, rtol=0, atol=1e-12)
+
+
+def _subband_meets_spec(sos, Fs, sub_band, ripple=0.5, gpass=3, gstop=40):
+    """Order from cheb1ord, pass band of sub-band k within the ripple, clearly attenuated stop edges"""
+    passband, stopband = subband_edges(sub_band)
+    N, _ = signal.cheb1ord(np.array(passband) / (Fs / 2), np.array(stopband) / (Fs / 2), gpass, gstop)
+    if len(sos) != N:
+        return False
+    freqs = np.concatenate([np.linspace(passband[0], passband[1], 64), stopband])
+    gain_db = 20 * np.log10(np.maximum(np.abs(signal.sosfreqz(sos, worN=freqs, fs=Fs)[1]), 1e-300))
+    pass_db, stop_db = gain_db[:-2], gain_db[-2:]
+    return np.all(pass_db <= 0.01) and np.all(pass_db >= -ripple - 0.01) and np.all(stop_db <= -gstop / 2)
+
+
+def _sos_is_valid(sos):
+    """Finite (sections, 6) SOS with normalised a0 and all poles inside the unit circle"""
+    if sos.ndim != 2 or sos.shape[1] != 6 or sos.shape[0] == 0 or not np.all(np.isfinite(sos)):
+        return False
+    if not np.all(sos[:, 3] == 1):
+        return False
+    return all(np.all(np.abs(np.roots(section[3:])) < 1) for section in sos)
+
+
+class FilterDesignRegistry:
+    """Designed SOS coefficients persisted to a small .npz cache file, keyed by the full design spec
+
+    Keys spell out Fs, pass/stop edges, ripple, attenuation and the notch spec, so a change
+    of any parameter is a different entry. Entries are checked on load (spec string, SHA-256
+    of the coefficient bytes, finite values, stable poles) and, on first use, against the
+    spec they are stored under (frequency response at the notch harmonics or the sub-band
+    edges); anything off is redesigned. New designs are written by flush(), once per batch.
+    Callers get writable copies, since sosfiltfilt/sosfilt reject read-only coefficients.
+    Coefficients are stored as raw float64, so every component reading the same file gets
+    bit-identical filters. An unwritable cache location only disables persistence.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('TLCCA_FILTER_CACHE') or os.path.join(
+            os.path.expanduser('~'), '.cache', 'tlcca', 'filter_designs.npz')
+        self.hits = 0
+        self.designed = 0
+        self.rejected = 0
+        self._designs = None
+        self._verified = set()
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def notch_spec(Fs, notch_freq=50, Q=35):
+        return f"notch|Fs={float(Fs)!r}|f0={float(notch_freq)!r}|Q={float(Q)!r}"
+
+    @staticmethod
+    def subband_spec(Fs, sub_band, ripple=0.5, gpass=3, gstop=40):
+        passband, stopband = subband_edges(sub_band)
+        return (f"cheby1|Fs={float(Fs)!r}|pass={passband[0]!r},{passband[1]!r}|"
+                f"stop={stopband[0]!r},{stopband[1]!r}|ripple={float(ripple)!r}|"
+                f"gpass={float(gpass)!r}|gstop={float(gstop)!r}")
+
+    def notch(self, Fs, notch_freq=50, Q=35):
+        """Cached design_notch_sos"""
+        return self._get(self.notch_spec(Fs, notch_freq, Q), lambda: design_notch_sos(Fs, notch_freq, Q),
+                         lambda sos: _notch_meets_spec(sos, Fs, notch_freq, Q))
+
+    def subband(self, Fs, sub_band, ripple=0.5, gpass=3, gstop=40):
+        """Cached design_subband_sos"""
+        return self._get(self.subband_spec(Fs, sub_band, ripple, gpass, gstop),
+                         lambda: design_subband_sos(Fs, sub_band, ripple, gpass, gstop),
+                         lambda sos: _subband_meets_spec(sos, Fs, sub_band, ripple, gpass, gstop))
+
+    def flush(self):
+        """Write the cache file if designs were added or rejected since the last write"""
+        with self._lock:
+            if self._dirty:
+                self._save()
+                self._dirty = False
+
+    def _get(self, spec, design, meets_spec):
+        with self._lock:
+            if self._designs is None:
+                self._designs = self._load()
+            sos = self._designs.get(spec)
+            if sos is not None and (spec in self._verified or meets_spec(sos)):
+                self._verified.add(spec)
+                self.hits += 1
+                return sos.copy()
+            if sos is not None:
+                self.rejected += 1  # intact bytes, but not the filter its spec describes
+
+            sos = np.ascontiguousarray(design(), dtype=np.float64)
+            sos.flags.writeable = False
+            self._designs[spec] = sos
+            self._verified.add(spec)
+            self.designed += 1
+            self._dirty = True
+            # Callers get a writable copy: sosfiltfilt/sosfilt reject read-only coefficient arrays
+            return sos.copy()
+
+    @staticmethod
+    def _entry_name(spec):
+        return hashlib.sha1(spec.encode()).hexdigest()[:16]
+
+    def _load(self):
+        designs = {}
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                for name in data.files:
+                    if not name.endswith('_sos'):
+                        continue
+                    entry = name[:-len('_sos')]
+                    try:
+                        spec = str(data[entry + '_spec'])
+                        digest = str(data[entry + '_sha256'])
+                        sos = np.ascontiguousarray(data[name], dtype=np.float64)
+                    except KeyError:
+                        self.rejected += 1
+                        self._dirty = True  # rewrite the file without the bad entry
+                        continue
+                    if (entry != self._entry_name(spec) or digest != hashlib.sha256(sos.tobytes()).hexdigest()
+                            or not _sos_is_valid(sos)):
+                        self.rejected += 1
+                        self._dirty = True
+                        continue
+                    sos.flags.writeable = False
+                    designs[spec] = sos
+        except (OSError, ValueError):
+            pass  # no cache yet, or unreadable - designs are rebuilt and the file rewritten
+        return designs
+
+    def _save(self):
+        arrays = {}
+        for spec, sos in self._designs.items():
+            entry = self._entry_name(spec)
+            arrays[entry + '_sos'] = sos
+            arrays[entry + '_spec'] = np.array(spec)
+            arrays[entry + '_sha256'] = np.array(hashlib.sha256(sos.tobytes()).hexdigest())
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, self.path)  # atomic, so a concurrent reader never sees half a file
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def default_filter_registry():
+    """Process-wide FilterDesignRegistry at the default cache path"""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = FilterDesignRegistry()
+        return _default_registry
+
+
+class TLCCAPreprocessor:
+    """Notch + filter-bank designs (SOS), built once and applied along one axis of any array
+
+    Zero-phase application mirrors the original per-channel filtfilt calls: data too short
+    for the filter padding (and sub-band input under 10 samples) is returned unfiltered.
+    Designs come from a FilterDesignRegistry (the shared on-disk cache by default);
+    notch_freq may also be a tuple of mains frequencies (combs cascaded), or None/() for no notch.
+    """
+
+    def __init__(self, Fs=250, num_of_subbands=5, notch_freq=50, notch_Q=35, registry=None):
+        self.Fs = Fs
+        self.num_of_subbands = num_of_subbands
+        self.notch_freq = notch_freq
+        self.registry = registry or default_filter_registry()
+        notch_freqs = tuple(np.atleast_1d(notch_freq)) if notch_freq else ()
+        if len(notch_freqs) == 1:
+            self.notch_sos = self.registry.notch(Fs, notch_freqs[0], notch_Q)
+        elif notch_freqs:
+            self.notch_sos = np.vstack([self.registry.notch(Fs, f0, notch_Q) for f0 in notch_freqs])
+        else:
+            self.notch_sos = np.zeros((0, 6))
+        self.band_sos = [self.registry.subband(Fs, sub_band) for sub_band in range(1, num_of_subbands + 1)]
+        self.registry.flush()  # one cache write for the whole set of designs
+
+    def notch(self, x, axis=-1):
+        """Zero-phase comb notch along axis"""
+        if len(self.notch_sos) == 0 or x.shape[axis] <= sosfiltfilt_padlen(self.notch_sos):
+            return x
+        return signal.sosfiltfilt(self.notch_sos, x, axis=axis)
+
+    def subband(self, x, sub_band, axis=-1):
+        """Zero-phase band-pass of sub-band (1-based) along axis"""
+        sos = self.band_sos[sub_band - 1]
+        if x.shape[axis] < 10 or x.shape[axis] <= sosfiltfilt_padlen(sos):
+            return x
+        return signal.sosfiltfilt(sos, x, axis=axis)
+
+    def filter_bank(self, x):
+        """Notch, then every sub-band: (..., channels, samples) -> (..., subbands, channels, samples)"""
+        notched = self.notch(x)
+        return np.stack([self.subband(notched, sub_band) for sub_band in range(1, self.num_of_subbands + 1)],
+                        axis=-3)
+
+    def causal_filter_bank(self, channels):
+        """Streaming (causal, stateful) counterpart of filter_bank"""
+        return CausalFilterBank(self.notch_sos, self.band_sos, channels)
+
+
+def sosfiltfilt_padlen(sos):
+    """Default edge padding of sosfiltfilt - inputs not longer than this cannot be filtered"""
+    return 3 * (2 * len(sos) + 1 - min(int(np.sum(sos[:, 2] == 0)), int(np.sum(sos[:, 5] == 0))))
+
+
+class LinearOperatorFilterBank:
+    """Zero-phase filter bank as precomputed T x T matrices for a discrete set of window lengths
+
+    For a fixed length, notch + band-pass filtfilt (odd padding and initial conditions
+    included) is a linear map, so op[b] = filter_bank(I) gives x @ op[b] == filtfilt output.
+    All bands are applied in one stacked GEMM over all channels; lengths outside the set
+    fall back to the IIR path. Operators of precompute_lengths are built up front, the
+    other allowed lengths on first use.
+
+    A bank for another notch choice can take its sub-band operators from `bands_from`, a bank
+    with the same band designs: it then keeps a single T x T notch operator per length and
+    applies the shared band-only operators after it (two GEMMs), so each extra notch choice
+    costs T^2 instead of subbands * T^2 doubles per length (about 0.7 MB instead of 3.6 MB at 1.2 s).
+    """
+
+    def __init__(self, preprocessor, lengths, precompute_lengths=(), bands_from=None):
+        self.preprocessor = preprocessor
+        self.lengths = frozenset(int(length) for length in lengths)
+        self.bands_from = bands_from
+        self._operators = {}
+        self._band_operators = {}
+        self._notch_operators = {}
+        self._lock = threading.Lock()
+        for length in precompute_lengths:
+            self.operator(length)
+
+    def _cached(self, cache, length, build):
+        if length not in self.lengths:
+            return None
+        op = cache.get(length)
+        if op is None:
+            op = build(np.eye(length))
+            op.flags.writeable = False
+            with self._lock:
+                op = cache.setdefault(length, op)
+        return op
+
+    def operator(self, length):
+        """(subbands, length, length) read-only operator, or None for lengths outside the set
+
+        For a bank built with bands_from this is the shared band-only operator; notch_operator runs first.
+        """
+        if self.bands_from is not None:
+            if length not in self.lengths:
+                return None
+            self.notch_operator(length)
+            return self.bands_from.band_operator(length)
+        return self._cached(self._operators, length, self.preprocessor.filter_bank)
+
+    def band_operator(self, length):
+        """(subbands, length, length) band-pass-only operator (no notch) - what banks built with bands_from share"""
+        pp = self.preprocessor
+        return self._cached(self._band_operators, length,
+                            lambda eye: np.stack([pp.subband(eye, sub_band)
+                                                  for sub_band in range(1, pp.num_of_subbands + 1)]))
+
+    def notch_operator(self, length):
+        """(length, length) notch operator; None outside the set or without a notch"""
+        if not len(self.preprocessor.notch_sos):
+            return None
+        return self._cached(self._notch_operators, length, self.preprocessor.notch)
+
+    def filter_bank(self, x, out=None, scratch=None):
+        """(..., channels, samples) -> (..., subbands, channels, samples), like TLCCAPreprocessor.filter_bank
+
+        scratch (shaped like x) takes the notched input of a bands_from bank, so that with out= the
+        operator path allocates nothing.
+        """
+        op = self.operator(x.shape[-1])
+        if op is None:
+            bank = self.preprocessor.filter_bank(x)
+            if out is None:
+                return bank
+            np.copyto(out, bank)
+            return out
+        if self.bands_from is not None:
+            notch_op = self.notch_operator(x.shape[-1])
+            if notch_op is not None:
+                x = np.matmul(x, notch_op, out=scratch)
+        return np.matmul(x[..., None, :, :], op, out=out)
+
+
+class FFTFilterBank:
+    """Zero-phase filter bank in the frequency domain for fixed-length windows
+
+    filtfilt applies |H(f)|^2 of each filter, so the whole bank is one rfft of the odd-extended
+    window, one multiplication by the stacked per-band masks and one batched irfft. Masks are
+    cached per window length. Bands that the filtfilt path leaves unfiltered for that length
+    (input not longer than the padding) get an all-pass mask, so short windows behave alike.
+
+    By default the notch still runs as a time-domain sosfiltfilt: on short windows the narrow
+    Q=35 comb is dominated by filtfilt edge transients that no frequency mask reproduces.
+    notch_in_mask=True folds the comb into the masks as well (two transforms in total).
+    """
+
+    def __init__(self, preprocessor, notch_in_mask=False, max_cached=32):
+        self.preprocessor = preprocessor
+        self.notch_in_mask = notch_in_mask
+        self.max_cached = max_cached
+        self._masks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def masks(self, length):
+        """(nfft, edge, masks (subbands, nfft//2 + 1)) for windows of length samples"""
+        with self._lock:
+            cached = self._masks.get(length)
+            if cached is not None:
+                self._masks.move_to_end(length)
+                return cached
+
+        pp = self.preprocessor
+        edge = length - 1
+        nfft = fft.next_fast_len(length + 2 * edge, real=True)
+        freqs = np.fft.rfftfreq(nfft, 1 / pp.Fs)
+
+        def power_response(sos):
+            return np.abs(signal.sosfreqz(sos, worN=freqs, fs=pp.Fs)[1]) ** 2
+
+        masks = np.ones((pp.num_of_subbands, len(freqs)))
+        for band, sos in enumerate(pp.band_sos):
+            if length >= 10 and length > sosfiltfilt_padlen(sos):
+                masks[band] = power_response(sos)
+        if self.notch_in_mask and len(pp.notch_sos) and length > sosfiltfilt_padlen(pp.notch_sos):
+            masks *= power_response(pp.notch_sos)
+        masks.flags.writeable = False
+
+        cached = (nfft, edge, masks)
+        with self._lock:
+            self._masks[length] = cached
+            while len(self._masks) > self.max_cached:
+                self._masks.popitem(last=False)
+        return cached
+
+    def filter_bank(self, x, out=None, scratch=None):
+        """(..., channels, samples) -> (..., subbands, channels, samples), like TLCCAPreprocessor.filter_bank
+
+        out only saves the caller an allocation; the transforms themselves allocate. scratch is
+        accepted for parity with LinearOperatorFilterBank and unused.
+        """
+        if out is not None:
+            np.copyto(out, self.filter_bank(x))
+            return out
+        if not self.notch_in_mask:
+            x = self.preprocessor.notch(x)
+        length = x.shape[-1]
+        if length < 2:
+            return np.stack([x] * self.preprocessor.num_of_subbands, axis=-3)
+
+        nfft, edge, masks = self.masks(length)
+        # Odd extension, as filtfilt pads its input
+        left = 2 * x[..., :1] - x[..., edge:0:-1]
+        right = 2 * x[..., -1:] - x[..., -2:-edge - 2:-1]
+        spectrum = fft.rfft(np.concatenate([left, x, right], axis=-1), nfft, axis=-1)
+
+        bands = fft.irfft(spectrum[..., None, :, :] * masks[:, None, :], nfft, axis=-1)
+        return bands[..., edge:edge + length]
+
+
+class FilteredBankCache:
+    """Small LRU cache of filtered banks (subbands, channels, samples) keyed by source and window samples
+
+    Sample indices restart with every loaded block or stream, so the caller passes a hashable
+    `generation` naming the data the indices refer to; equal windows of two sources never collide.
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._banks = OrderedDict()
+        self._lock = threading.Lock()  # GUI thread and recognition thread query the same engine
+
+    def get(self, start_sample, end_sample, generation=0):
+        """Cached bank for [start_sample, end_sample) of `generation`, or None"""
+        key = (generation, int(start_sample), int(end_sample))
+        with self._lock:
+            bank = self._banks.get(key)
+            if bank is None:
+                self.misses += 1
+                return None
+            self._banks.move_to_end(key)
+            self.hits += 1
+            return bank
+
+    def put(self, start_sample, end_sample, bank, generation=0):
+        """Store a bank - it is frozen read-only because callers share it"""
+        bank.flags.writeable = False
+        key = (generation, int(start_sample), int(end_sample))
+        with self._lock:
+            self._banks[key] = bank
+            self._banks.move_to_end(key)
+            while len(self._banks) > self.max_entries:
+                self._banks.popitem(last=False)
+
+    def clear(self):
+        """Drop all banks, e.g. when new source data is loaded"""
+        with self._lock:
+            self._banks.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class CausalFilterBank:
+    """Causal notch + sub-band filtering of a sample stream - SOS state carried between chunks
+
+    Each filter runs as second-order sections with a zi state of shape (sections, channels, 2),
+    so every sample is filtered exactly once, when it arrives. Unlike the per-window filtfilt,
+    a sample's filtered value never changes afterwards, which is what history reads and
+    running-sum scoring need.
+    """
+
+    def __init__(self, notch_sos, band_sos, channels):
+        self.notch_sos = np.asarray(notch_sos)
+        self.band_sos = [np.asarray(sos) for sos in band_sos]
+        self.channels = channels
+        self.reset()
+
+    def reset(self):
+        """Zero filter state (start of a new stream)"""
+        self._notch_zi = np.zeros((self.notch_sos.shape[0], self.channels, 2))
+        self._band_zi = [np.zeros((sos.shape[0], self.channels, 2)) for sos in self.band_sos]
+
+    def process(self, chunk):
+        """Filter the next (channels, k) samples -> (subbands, channels, k)"""
+        if len(self.notch_sos):
+            notched, self._notch_zi = signal.sosfilt(self.notch_sos, chunk, axis=-1, zi=self._notch_zi)
+        else:
+            notched = chunk
+        bands = []
+        for band, sos in enumerate(self.band_sos):
+            filtered, self._band_zi[band] = signal.sosfilt(sos, notched, axis=-1, zi=self._band_zi[band])
+            bands.append(filtered)
+        return np.stack(bands)
+
+
+class LineNoiseEstimator:
+    """Per-channel mains interference level - single-bin DFTs (Goertzel) accumulated chunk by chunk
+
+    Every block of block_size samples yields, per channel, the power at each harmonic of each
+    mains candidate (those the notch comb would remove) and at guard bins offset_hz either
+    side, which serve as the local noise floor. Block powers are smoothed exponentially.
+    A channel is assigned every candidate whose harmonics stand at least threshold_db above
+    their floor - () if no line is visible and notching would not help.
+    """
+
+    def __init__(self, Fs, channels, mains=(50, 60), block_size=None, offset_hz=3.0, smoothing=0.3,
+                 threshold_db=6.0):
+        self.Fs = Fs
+        self.channels = channels
+        self.mains = tuple(mains)
+        self.block_size = block_size or int(round(Fs))  # 1 s: integer-Hz lines fall on exact bins
+        self.smoothing = smoothing
+        self.threshold_db = threshold_db
+
+        freqs, self._line_idx, self._floor_idx = [], {}, {}
+        for f0 in self.mains:
+            harmonics = [k * f0 for k in range(1, int(np.floor((Fs / 2) / f0)) + 1)]
+            floors = [f for h in harmonics for f in (h - offset_hz, h + offset_hz) if 0 < f < Fs / 2]
+            self._line_idx[f0] = np.arange(len(freqs), len(freqs) + len(harmonics))
+            freqs += harmonics
+            self._floor_idx[f0] = np.arange(len(freqs), len(freqs) + len(floors))
+            freqs += floors
+        self.freqs = np.array(freqs, dtype=float)
+        self._basis = np.exp(-2j * np.pi * self.freqs[:, None] * np.arange(self.block_size) / Fs)
+        self.reset()
+
+    def reset(self):
+        """Forget all measurements"""
+        self._acc = np.zeros((self.channels, len(self.freqs)), dtype=complex)
+        self._pos = 0
+        self.power = None  # smoothed (channels, freqs) bin power
+        self.blocks = 0
+
+    def update(self, chunk):
+        """Accumulate the next (channels, k) samples; completes a block every block_size samples"""
+        offset = 0
+        while offset < chunk.shape[1]:
+            take = min(self.block_size - self._pos, chunk.shape[1] - offset)
+            self._acc += chunk[:, offset:offset + take] @ self._basis[:, self._pos:self._pos + take].T
+            self._pos += take
+            offset += take
+            if self._pos == self.block_size:
+                block_power = np.abs(self._acc) ** 2 / self.block_size
+                self.power = block_power if self.power is None else (
+                    (1 - self.smoothing) * self.power + self.smoothing * block_power)
+                self._acc[:] = 0
+                self._pos = 0
+                self.blocks += 1
+
+    def line_to_floor_db(self):
+        """{mains: (channels,) harmonic power over guard-bin power in dB}, or None before the first block"""
+        if self.power is None:
+            return None
+        tiny = np.finfo(float).tiny
+        return {f0: 10 * np.log10((self.power[:, self._line_idx[f0]].mean(axis=1) + tiny) /
+                                  (self.power[:, self._floor_idx[f0]].mean(axis=1) + tiny))
+                for f0 in self.mains}
+
+    def select(self):
+        """Per channel, the tuple of mains frequencies to notch (() if none), or None before the first block"""
+        ratios = self.line_to_floor_db()
+        if ratios is None:
+            return None
+        return tuple(tuple(f0 for f0 in self.mains if ratios[f0][ch] >= self.threshold_db)
+                     for ch in range(self.channels))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TLCCA decision scheduling - when the online loop wakes up to score a window
+"""
+
+import time
+from collections import namedtuple
+
+import numpy as np
+
+
+# One scheduled recognition: window [start_sample, end_sample) of character char_idx, due at `time` seconds
+Decision = namedtuple('Decision', ['char_idx', 'start_sample', 'end_sample', 'time'])
+
+
+def sleep_until(deadline, clock=time.monotonic, sleep=time.sleep):
+    """Sleep until clock() >= deadline - one blocking sleep, no busy-wait; returns the lateness (s)"""
+    remaining = deadline - clock()
+    if remaining > 0:
+        sleep(remaining)
+    return clock() - deadline
+
+
+class ReplayClock:
+    """Virtual block clock for replaying recorded data faster than real time
+
+    speed=None jumps straight to every deadline (as fast as the CPU allows); speed=k runs
+    the block k times faster than real time on the monotonic clock. Pass the instance as
+    the clock and its sleep() as the sleep of a DecisionScheduler: the decisions, their
+    windows and everything ingested stay those of a real-time run.
+    """
+
+    def __init__(self, speed=None, clock=time.monotonic, sleep=time.sleep):
+        if speed is not None and speed <= 0:
+            raise ValueError(f"replay speed must be positive or None, got {speed}")
+        self.speed = speed
+        self._clock = clock
+        self._sleep = sleep
+        self._origin = clock()
+        self._virtual = 0.0
+
+    def __call__(self):
+        """Virtual seconds since the clock was created"""
+        if self.speed is None:
+            return self._virtual
+        return (self._clock() - self._origin) * self.speed
+
+    def sleep(self, seconds):
+        """Let `seconds` of virtual time pass"""
+        if self.speed is None:
+            self._virtual += seconds
+        else:
+            self._sleep(seconds / self.speed)
+
+
+class DecisionScheduler:
+    """Deadline-driven decision timeline of a cue-paced block
+
+    Every character occupies char_duration seconds: a cue, then the flicker. Recognition
+    starts at recognition_start_offset (cue + physiological latency) and may go on until
+    recognition_end_offset (end of the flicker). The first decision of a character is the
+    first instant whose window reaches min_samples; after that one decision every
+    stride_samples, each scoring the newest window_samples (clipped at the recognition
+    start). Decision times are exact multiples of the sample period, so the timeline is
+    the same on every run; only the wake-up lateness depends on the machine.
+    """
+
+    def __init__(self, Fs, char_duration, num_chars, recognition_start_offset, recognition_end_offset,
+                 window_samples, min_samples, stride_samples, duration=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.Fs = Fs
+        self.char_duration = char_duration
+        self.num_chars = num_chars
+        self.recognition_start_offset = recognition_start_offset
+        self.recognition_end_offset = recognition_end_offset
+        self.window_samples = int(window_samples)
+        self.min_samples = int(min_samples)
+        self.stride_samples = max(1, int(stride_samples))
+        self.duration = duration
+        self.clock = clock
+        self.sleep = sleep
+        self.origin = None
+        self.lateness = []
+
+    def decisions(self):
+        """All decisions of the block in time order"""
+        for char_idx in range(self.num_chars):
+            char_start_time = char_idx * self.char_duration
+            recognition_start = int((char_start_time + self.recognition_start_offset) * self.Fs)
+            recognition_end = int((char_start_time + self.recognition_end_offset) * self.Fs)
+            for end_sample in range(recognition_start + self.min_samples, recognition_end + 1, self.stride_samples):
+                decision_time = end_sample / self.Fs
+                if self.duration is not None and decision_time >= self.duration:
+                    return
+                start_sample = max(end_sample - self.window_samples, recognition_start)
+                yield Decision(char_idx, start_sample, end_sample, decision_time)
+
+    def start(self):
+        """Anchor the timeline at the current clock reading (block time 0)"""
+        self.origin = self.clock()
+        self.lateness = []
+
+    def elapsed(self):
+        """Block time (s) since start()"""
+        return self.clock() - self.origin
+
+    def wait(self, decision):
+        """Sleep until the decision is due and record how late the wake-up was (s)"""
+        sleep_until(self.origin + decision.time, self.clock, self.sleep)
+        return self.record(decision)
+
+    def record(self, decision):
+        """Record how late the decision starts now (s) - for callers that wait on something else, e.g. data"""
+        lateness = self.elapsed() - decision.time
+        self.lateness.append(lateness)
+        return lateness
+
+    def lateness_summary(self):
+        """Wake-up lateness statistics in ms (empty dict before any decision)"""
+        if not self.lateness:
+            return {}
+        late_ms = np.asarray(self.lateness) * 1000
+        return {
+            'decisions': len(late_ms),
+            'mean_ms': float(np.mean(late_ms)),
+            'p95_ms': float(np.percentile(late_ms, 95)),
+            'max_ms': float(np.max(late_ms)),
+        }
@@ -0,0 +1,635 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batched TLCCA scoring kernel - scores every character of a window in one pass per sub-band
+"""
+
+import numpy as np
+
+
+# Window lengths offered by the engines (seconds)
+WINDOW_OPTIONS = (0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2)
+
+
+def generate_reference_bank(freqs, phases, length, num_of_harmonics, Fs):
+    """Multi-harmonic cos/sin references for all classes - (classes, 2*harmonics, length)"""
+    t = np.arange(length) / Fs
+    harmonics = np.arange(1, num_of_harmonics + 1)
+    harmonic_freq = freqs[:, None] * harmonics[None, :]
+    harmonic_phase = phases[:, None] * harmonics[None, :]
+
+    # Same operation order as generate_reference_signals, so the values are bit-identical
+    arg = 2 * np.pi * harmonic_freq[:, :, None] * t[None, None, :] + harmonic_phase[:, :, None]
+    refs = np.empty((len(freqs), 2 * num_of_harmonics, length))
+    refs[:, 0::2, :] = np.cos(arg)
+    refs[:, 1::2, :] = np.sin(arg)
+    return refs
+
+
+def row_correlations(a, b):
+    """|Pearson r| between matching rows of a and b (0 where a row is constant)"""
+    a = a - np.mean(a, axis=-1, keepdims=True)
+    b = b - np.mean(b, axis=-1, keepdims=True)
+    num = np.sum(a * b, axis=-1)
+    den = np.sqrt(np.sum(a * a, axis=-1) * np.sum(b * b, axis=-1))
+
+    r = np.zeros(num.shape, dtype=num.dtype)
+    valid = den > 0
+    r[valid] = np.abs(num[valid] / den[valid])
+    return np.minimum(r, 1.0)
+
+
+def canoncorr_correlations(P, Q, C):
+    """r3 for every class - single-column matlab_canoncorr_exact via a precomputed QR
+
+    With one X column the X-side weight is a scalar, so the first canonical pair only
+    depends on u = Q^T x, where Q R = centered reference. The reference-side weight that
+    matlab_canoncorr_exact produces (B = Ly^-T Ly^-T Cxy^T) maps to C = R Ly^-T Ly^-T R^T,
+    giving r3 = |u^T C u| / (|x_centered| |C u|): one small matvec and a few norms.
+    Q and C come from canoncorr_basis, cached per window length by ReferenceBank.cca_basis;
+    P may carry leading batch dimensions, i.e. (..., classes, T).
+    """
+    P_centered = P - np.mean(P, axis=-1, keepdims=True)
+    U = np.einsum('...ct,ctk->...ck', P_centered, Q)
+    V = np.einsum('ckj,...cj->...ck', C, U)
+
+    num = np.abs(np.sum(U * V, axis=-1))
+    den = np.sqrt(np.sum(P_centered * P_centered, axis=-1) * np.sum(V * V, axis=-1))
+
+    r = np.zeros(num.shape, dtype=num.dtype)
+    valid = den > 0
+    r[valid] = num[valid] / den[valid]
+    return np.minimum(r, 1.0)
+
+
+def canoncorr_basis(refs):
+    """Q and C for canoncorr_correlations - from (classes, K, T) references"""
+    length = refs.shape[-1]
+    refs_centered = refs - np.mean(refs, axis=-1, keepdims=True)
+    Q, R = np.linalg.qr(np.swapaxes(refs_centered, 1, 2))
+
+    # Cyy = R^T R / (n-1), regularised exactly like matlab_canoncorr_exact
+    R_T = np.swapaxes(R, 1, 2)
+    Ly = np.linalg.cholesky(np.matmul(R_T, R) / (length - 1) + 1e-12 * np.eye(refs.shape[1]))
+    Ly_T = np.swapaxes(Ly, 1, 2)
+    C = np.matmul(R, np.linalg.solve(Ly_T, np.linalg.solve(Ly_T, R_T)))
+    return Q, C
+
+
+def regularized_canoncorr(X, Y, reg=1e-8):
+    """First canonical pair (A, B) via eigendecomposition - deterministic canoncorr fallback
+
+    Same return contract as matlab_canoncorr_exact. Covariance eigenvalues are floored at
+    reg times the largest one, so rank-deficient or constant inputs still give finite
+    weights; the sign is fixed so the largest-magnitude entry of A is positive.
+    """
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    if X.ndim == 1:
+        X = X.reshape(-1, 1)
+    if Y.ndim == 1:
+        Y = Y.reshape(-1, 1)
+    X = X - np.mean(X, axis=0)
+    Y = Y - np.mean(Y, axis=0)
+
+    n = max(X.shape[0] - 1, 1)
+    Kx = _inverse_sqrt((X.T @ X) / n, reg)
+    Ky = _inverse_sqrt((Y.T @ Y) / n, reg)
+
+    U, s, Vt = np.linalg.svd(Kx @ ((X.T @ Y) / n) @ Ky)
+    A = Kx @ U[:, 0]
+    B = Ky @ Vt[0, :]
+
+    if A[np.argmax(np.abs(A))] < 0:
+        A, B = -A, -B
+    return A, B
+
+
+def _inverse_sqrt(C, reg):
+    """C^-1/2 of a symmetric PSD matrix with eigenvalues floored at reg * max eigenvalue"""
+    w, V = np.linalg.eigh(C)
+    scale = np.max(w)
+    w = np.maximum(w, reg * scale if scale > 0 else 1.0)
+    return (V / np.sqrt(w)) @ V.T
+
+
+class ReferenceBank:
+    """Reference signals built once per stimulus set - every window length is a prefix view
+
+    dtype sets the precision of the stored references and CCA bases; they are always
+    computed in float64 and only then cast.
+    """
+
+    def __init__(self, freqs, phases, num_of_harmonics, Fs, max_len, precompute_lengths=(), max_cached=64,
+                 dtype=np.float64):
+        self.freqs = np.asarray(freqs, dtype=float)
+        self.phases = np.asarray(phases, dtype=float)
+        self.num_of_harmonics = num_of_harmonics
+        self.Fs = Fs
+        self.max_len = int(max_len)
+        self.max_cached = max_cached
+        self.dtype = np.dtype(dtype)
+
+        # (classes, 2*harmonics, max_len); t starts at 0, so shorter windows are exact prefixes
+        self._refs64 = generate_reference_bank(self.freqs, self.phases, self.max_len, num_of_harmonics, Fs)
+        self.refs = self._refs64.astype(self.dtype, copy=False)
+        self._refs64.flags.writeable = False
+        self.refs.flags.writeable = False
+
+        self._cca_basis = {}
+        self._window_moments = {}
+        for length in precompute_lengths:
+            self.cca_basis(length)
+
+    def references(self, length):
+        """(classes, 2*harmonics, length) references - zero-copy view up to max_len"""
+        if length <= self.max_len:
+            return self.refs[:, :, :length]
+        refs = generate_reference_bank(self.freqs, self.phases, length, self.num_of_harmonics, self.Fs)
+        return refs.astype(self.dtype, copy=False)
+
+    def cca_basis(self, length):
+        """QR basis Q and canoncorr weighting C of the centered references for one window length"""
+        basis = self._cca_basis.get(length)
+        if basis is not None:
+            return basis
+
+        if length <= self.max_len:
+            refs = self._refs64[:, :, :length]
+        else:
+            refs = generate_reference_bank(self.freqs, self.phases, length, self.num_of_harmonics, self.Fs)
+        Q, C = canoncorr_basis(refs)
+
+        basis = (Q.astype(self.dtype, copy=False), C.astype(self.dtype, copy=False))
+        for array in basis:
+            array.flags.writeable = False
+
+        if length <= self.max_len:
+            if len(self._cca_basis) >= self.max_cached:
+                self._cca_basis.pop(next(iter(self._cca_basis)))
+            self._cca_basis[length] = basis
+        return basis
+
+
+    def window_moments(self, length):
+        """Window-relative reference moments for the running-sum scorer (float64)
+
+        Returns the per-class reference means (classes, 2H), the centered Gram
+        Syy = Yc^T Yc and M = Ly^-T Ly^-T, where Ly is the Cholesky factor that
+        matlab_canoncorr_exact uses (both (classes, 2H, 2H)).
+        """
+        moments = self._window_moments.get(length)
+        if moments is not None:
+            return moments
+
+        if length <= self.max_len:
+            refs = self._refs64[:, :, :length]
+        else:
+            refs = generate_reference_bank(self.freqs, self.phases, length, self.num_of_harmonics, self.Fs)
+        ref_mean = np.mean(refs, axis=-1)
+        refs_centered = refs - ref_mean[:, :, None]
+        Syy = np.matmul(refs_centered, np.swapaxes(refs_centered, 1, 2))
+
+        Ly = np.linalg.cholesky(Syy / (length - 1) + 1e-12 * np.eye(refs.shape[1]))
+        Ly_T = np.swapaxes(Ly, 1, 2)
+        identity = np.broadcast_to(np.eye(refs.shape[1]), Syy.shape)
+        M = np.linalg.solve(Ly_T, np.linalg.solve(Ly_T, identity))
+
+        moments = (ref_mean, Syy, M)
+        for array in moments:
+            array.flags.writeable = False
+
+        if length <= self.max_len:
+            if len(self._window_moments) >= self.max_cached:
+                self._window_moments.pop(next(iter(self._window_moments)))
+            self._window_moments[length] = moments
+        return moments
+
+
+class ScoringWorkspace:
+    """Reusable scratch buffers for the decision path - sized up front, reused by every window
+
+    Each named buffer is one flat array; get() hands out a contiguous view of its leading
+    elements, so any window up to the reserved size runs without allocating. Only a
+    request larger than the buffer allocates (and grows it); `allocations` counts those,
+    so in steady state it stops moving.
+    """
+
+    def __init__(self, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        self.allocations = 0
+        self._buffers = {}
+
+    def reserve(self, name, shape, dtype=None):
+        """Make sure buffer name can hold shape without allocating later"""
+        self.get(name, shape, dtype)
+
+    def get(self, name, shape, dtype=None):
+        """Contiguous (shape) view of buffer name - contents are left from the previous use"""
+        dtype = self.dtype if dtype is None else np.dtype(dtype)
+        size = int(np.prod(shape))
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.size < size or buffer.dtype != dtype:
+            buffer = np.empty(max(size, 1), dtype=dtype)
+            self._buffers[name] = buffer
+            self.allocations += 1
+        return buffer[:size].reshape(shape)
+
+    @property
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+
+class BatchedTLCCAScorer:
+    """All-class TLCCA scoring over a CompiledTLCCAModel - one projection GEMM per sub-band
+
+    dtype=np.float32 runs projections and correlations in single precision (half the
+    memory traffic); the model weights and reference bases are cast once here.
+    """
+
+    def __init__(self, model, dtype=np.float64):
+        self.model = model
+        self.num_classes = model.num_classes
+        self.dtype = np.dtype(dtype)
+
+        # Weights in the scoring precision (the float64 model itself stays untouched)
+        self.Wx = model.Wx.astype(self.dtype, copy=False)
+        self.Wy = model.Wy.astype(self.dtype, copy=False)
+        self.templates = model.templates.astype(self.dtype, copy=False)
+        self.FB_coef = model.FB_coef.astype(self.dtype, copy=False)
+
+        # Reference bank for all characters, with the selectable window lengths precomputed
+        Fs = model.Fs
+        self.ref_bank = ReferenceBank(
+            model.char_table['freq'], model.char_table['phase'], model.num_of_harmonics, Fs,
+            max_len=int(round(max(WINDOW_OPTIONS) * Fs)),
+            precompute_lengths=[int(round(w * Fs)) for w in WINDOW_OPTIONS],
+            dtype=self.dtype)
+
+        # Centered per-band reference projections / template prefixes for the workspace path
+        self._band_refs = {}
+        self._band_templates = {}
+
+    def score(self, X_bands, workspace=None):
+        """Score one window - X_bands[b] is the (channels, T) window filtered by sub-band b+1
+
+        With a ScoringWorkspace every intermediate is written into its buffers and the
+        returned (classes,) scores are a view into it, valid until the next call.
+        """
+        if workspace is not None:
+            return self.score_into(np.asarray(X_bands)[None], workspace)[0]
+        return self.score_batch(np.asarray(X_bands)[None])[0]
+
+    def reserve_workspace(self, workspace, channels, max_len, num_windows=1):
+        """Size a workspace for windows up to max_len samples (plus their band/template tables)"""
+        N, K, sb = num_windows, self.num_classes, self.model.num_of_subbands
+        two_h = self.Wy.shape[1]
+        workspace.reserve('bank', (N, sb, channels, max_len), dtype=np.float64)
+        workspace.reserve('P', (N, K, max_len))
+        for name in ('scores', 'mean', 'num', 'norm', 'den', 'r1a', 'r1b', 'r3'):
+            workspace.reserve(name, (N, K))
+        workspace.reserve('valid', (N, K), dtype=bool)
+        workspace.reserve('U', (N, K, two_h))
+        workspace.reserve('V', (N, K, two_h))
+        if self.dtype != np.float64:
+            workspace.reserve('bank_cast', (N, sb, channels, max_len))
+        return workspace
+
+    def band_references(self, b, length):
+        """Centered Wy-weighted references of band b and their squared norms, memoised per length"""
+        cached = self._band_refs.get((b, length))
+        if cached is None:
+            Y_proj = np.einsum('kc,ckt->ct', self.Wy[b], self.ref_bank.references(length))
+            Y_proj = Y_proj - np.mean(Y_proj, axis=-1, keepdims=True)
+            cached = (Y_proj, np.sum(Y_proj * Y_proj, axis=-1))
+            for array in cached:
+                array.flags.writeable = False
+            cached = self._band_refs.setdefault((b, length), cached)
+        return cached
+
+    def band_templates(self, b, length):
+        """Centered template prefixes (classes, length) of band b and their squared norms, memoised"""
+        cached = self._band_templates.get((b, length))
+        if cached is None:
+            H = np.ascontiguousarray(self.templates[b, :length].T)
+            H = H - np.mean(H, axis=-1, keepdims=True)
+            cached = (H, np.sum(H * H, axis=-1))
+            for array in cached:
+                array.flags.writeable = False
+            cached = self._band_templates.setdefault((b, length), cached)
+        return cached
+
+    def score_into(self, banks, workspace):
+        """score_batch with every intermediate in workspace buffers (out= throughout) -> (N, classes) view
+
+        P is never centered explicitly (a broadcast subtraction would buffer internally):
+        the references, template prefixes and QR basis Q are all centered already, so the
+        raw projections give the same dot products, and the centered norms follow from
+        sum(p^2) - sum(p)^2 / T.
+        """
+        model, ws = self.model, workspace
+        N, _, channels, T = banks.shape
+        K = self.num_classes
+        if banks.dtype != self.dtype:
+            cast = ws.get('bank_cast', banks.shape)
+            np.copyto(cast, banks)
+            banks = cast
+
+        scores = ws.get('scores', (N, K))
+        scores.fill(0)
+        if self.Wx.shape[1] != channels:
+            return scores
+        Q, C = self.ref_bank.cca_basis(T)
+
+        P = ws.get('P', (N, K, T))
+        total, num, norm = ws.get('mean', (N, K)), ws.get('num', (N, K)), ws.get('norm', (N, K))
+        r1a, r1b, r3 = ws.get('r1a', (N, K)), ws.get('r1b', (N, K)), ws.get('r3', (N, K))
+        U, V = ws.get('U', (N, K, Q.shape[-1])), ws.get('V', (N, K, Q.shape[-1]))
+
+        for b in range(model.num_of_subbands):
+            np.matmul(self.Wx[b].T, banks[:, b], out=P)
+
+            # r1b: target-domain projection prefix vs. transferred template
+            template_len = min(int(model.template_len[b]), T)
+            has_r1b = template_len > 10
+            if has_r1b:
+                H, H_norm = self.band_templates(b, template_len)
+                prefix = P[..., :template_len]
+                _rowdot(prefix, H, num)
+                self._centered_norm_into(prefix, total, norm, ws)
+                self._ratio_into(num, norm, H_norm, model.r1b_mask[b], r1b, ws)
+
+            # Centered squared norm of P, shared by r1a and r3
+            self._centered_norm_into(P, total, norm, ws)
+
+            # r1a: source-domain projection vs. Wy-weighted reference
+            Y_proj, Y_norm = self.band_references(b, T)
+            _rowdot(P, Y_proj, num)
+            self._ratio_into(num, norm, Y_norm, model.r1a_mask[b], r1a, ws)
+
+            # r3: QR fast path as in canoncorr_correlations
+            np.matmul(P[..., None, :], Q, out=U[..., None, :])
+            np.matmul(C, U[..., None], out=V[..., None])
+            _rowdot(U, V, num)
+            _rowdot(V, V, r3)
+            self._ratio_into(num, norm, r3, model.r3_mask[b], r3, ws)
+
+            np.square(r1a, out=r1a)
+            if has_r1b:
+                np.square(r1b, out=r1b)
+                np.add(r1a, r1b, out=r1a)
+            np.square(r3, out=r3)
+            np.add(r1a, r3, out=r1a)
+            np.multiply(r1a, self.FB_coef[b], out=r1a)
+            np.add(scores, r1a, out=scores)
+
+        return scores
+
+    @staticmethod
+    def _centered_norm_into(P, total, out, ws):
+        # out = sum((p - mean)^2) = sum(p^2) - sum(p)^2 / T, clipped at 0 against rounding
+        correction = ws.get('den', out.shape)
+        np.add.reduce(P, axis=-1, out=total)
+        _rowdot(P, P, out)
+        np.multiply(total, total, out=correction)
+        np.divide(correction, P.shape[-1], out=correction)
+        np.subtract(out, correction, out=out)
+        np.maximum(out, 0, out=out)
+
+    @staticmethod
+    def _ratio_into(num, norm_a, norm_b, mask, out, ws):
+        # out = min(|num| / sqrt(norm_a * norm_b), 1) * mask; 0 where a norm is 0 (num is 0 there too)
+        den = ws.get('den', num.shape)
+        valid = ws.get('valid', num.shape, dtype=bool)
+        np.multiply(norm_a, norm_b, out=den)
+        np.sqrt(den, out=den)
+        np.greater(den, 0, out=valid)
+        np.abs(num, out=out)
+        np.divide(out, den, out=out, where=valid)
+        np.minimum(out, 1.0, out=out)
+        np.multiply(out, mask, out=out)
+
+    def score_batch(self, banks):
+        """Score N equal-length windows at once - banks is (N, subbands, channels, T) -> (N, classes)"""
+        model = self.model
+        banks = np.asarray(banks, dtype=self.dtype)
+        N, _, channels, T = banks.shape
+        refs = self.ref_bank.references(T)
+        Q, C = self.ref_bank.cca_basis(T)
+
+        scores = np.zeros((N, self.num_classes), dtype=self.dtype)
+        if self.Wx.shape[1] != channels:
+            return scores
+
+        for b in range(model.num_of_subbands):
+            # One GEMM projects every window through every class's spatial filter: (N, classes, T)
+            P = np.matmul(self.Wx[b].T, banks[:, b])
+
+            # r1a: source-domain projection vs. Wy-weighted reference
+            Y_proj = np.einsum('kc,ckt->ct', self.Wy[b], refs)
+            r1a = row_correlations(P, Y_proj) * model.r1a_mask[b]
+
+            # r1b: target-domain projection vs. transferred template
+            r1b = np.zeros((N, self.num_classes), dtype=self.dtype)
+            template_len = min(int(model.template_len[b]), T)
+            if template_len > 10:
+                r1b = row_correlations(P[..., :template_len], self.templates[b, :template_len].T) * model.r1b_mask[b]
+
+            # r3: single-projection CCA against the harmonic reference (QR fast path)
+            r3 = canoncorr_correlations(P, Q, C) * model.r3_mask[b]
+
+            # Formula 10/11: rho = sum of sign(r)*r^2, weighted by the FB coefficients
+            scores += self.FB_coef[b] * (r1a**2 + r1b**2 + r3**2)
+
+        return scores
+
+
+def _rowdot(a, b, out):
+    """out[...] = sum(a * b, axis=-1) as a batched (1 x T) @ (T x 1) matmul - no temporaries"""
+    np.matmul(a[..., None, :], b[..., :, None], out=out[..., None, None])
+    return out
+
+
+def compare_scorers(reference_scorer, candidate_scorer, banks):
+    """Parity of two scorers on the same filtered banks (N, subbands, channels, T)
+
+    Returns the maximum absolute score deviation and the fraction of windows whose
+    predicted class (argmax) differs.
+    """
+    reference = np.asarray(reference_scorer.score_batch(banks), dtype=np.float64)
+    candidate = np.asarray(candidate_scorer.score_batch(banks), dtype=np.float64)
+    disagreements = int(np.sum(np.argmax(reference, axis=1) != np.argmax(candidate, axis=1)))
+    return {
+        'windows': len(reference),
+        'max_score_deviation': float(np.max(np.abs(reference - candidate))) if len(reference) else 0.0,
+        'argmax_disagreements': disagreements,
+        'argmax_disagreement_rate': disagreements / max(len(reference), 1),
+    }
+
+
+class SlidingWindowTLCCAScorer:
+    """Running-sum TLCCA scoring of a sliding window over a filtered sample stream
+
+    Every pushed sample is projected once through all spatial filters; per band and
+    class the scorer keeps sum(p), sum(p^2) and sum(p*cos(wt)), sum(p*sin(wt)) in
+    absolute stream time. Rotating those by the window start gives the Gram block
+    against the window-relative references, so r1a and r3 need no pass over the
+    window. Samples leaving the window are subtracted; the sums are rebuilt from
+    the projection history once per capacity samples to bound rounding drift. r1b
+    (template correlation, aligned to the window start) is not incremental: it is
+    recomputed from the projection history, O(window) per decision (see score_window).
+
+    Scores match BatchedTLCCAScorer on the same filtered samples; the samples must
+    come from a causal filter, since a window-wise filtfilt changes past samples.
+    """
+
+    def __init__(self, scorer, capacity):
+        self.scorer = scorer
+        self.model = scorer.model
+        self.ref_bank = scorer.ref_bank
+        self.capacity = int(capacity)
+        self.num_classes = scorer.num_classes
+
+        model = self.model
+        harmonics = np.arange(1, model.num_of_harmonics + 1)
+        # Per class and harmonic: angular step per sample and phase of the reference
+        self.omega = 2 * np.pi * self.ref_bank.freqs[:, None] * harmonics[None, :] / model.Fs
+        self.phase = self.ref_bank.phases[:, None] * harmonics[None, :]
+
+        self.WxT = np.ascontiguousarray(np.swapaxes(model.Wx, 1, 2))  # (bands, classes, channels)
+        self.r1b_classes = np.flatnonzero(np.any(model.r1b_mask, axis=0))
+        self.reset()
+
+    def reset(self, first_sample=0):
+        """Empty window starting at absolute sample index first_sample"""
+        model = self.model
+        shape = (model.num_of_subbands, self.num_classes)
+        self.start = self.end = int(first_sample)
+        self._history = np.zeros(shape + (self.capacity,))
+        self._sum = np.zeros(shape)
+        self._sum_sq = np.zeros(shape)
+        self._sum_cos = np.zeros(shape + (model.num_of_harmonics,))
+        self._sum_sin = np.zeros(shape + (model.num_of_harmonics,))
+        self._since_refresh = 0
+
+    def push(self, bank_chunk, first_sample=None):
+        """Append filtered samples (subbands, channels, k); first_sample defaults to the stream end"""
+        bank_chunk = np.asarray(bank_chunk, dtype=np.float64)
+        if first_sample is not None and first_sample != self.end:
+            self.reset(first_sample)
+
+        k = bank_chunk.shape[-1]
+        if k > self.capacity:
+            # Only the newest capacity samples can ever be part of a window
+            self.reset(self.end + k - self.capacity)
+            bank_chunk = bank_chunk[..., k - self.capacity:]
+            k = self.capacity
+        if k == 0:
+            return
+
+        if self.end + k - self.start > self.capacity:
+            self.retire(self.end + k - self.capacity)
+
+        P = np.matmul(self.WxT, bank_chunk)  # (bands, classes, k)
+        self._accumulate(P, self.end, 1.0)
+
+        index = np.arange(self.end, self.end + k) % self.capacity
+        self._history[:, :, index] = P
+        self.end += k
+
+        self._since_refresh += k
+        if self._since_refresh >= self.capacity:
+            self._refresh()
+
+    def retire(self, new_start):
+        """Drop samples before absolute index new_start from the running sums"""
+        new_start = int(new_start)
+        if new_start <= self.start:
+            return
+        if new_start >= self.end:
+            self.reset(new_start)
+            return
+        index = np.arange(self.start, new_start) % self.capacity
+        self._accumulate(self._history[:, :, index], self.start, -1.0)
+        self.start = new_start
+
+    def score_window(self, start, end):
+        """Scores (classes,) for the window [start, end), or None if the stream cannot serve it
+
+        The window must end at the newest pushed sample; start may only move forward.
+        r1a and r3 cost O(1) in the window length. r1b does not: the template is aligned to
+        the window start, so every new start is a new lag with no running sum to update, and
+        each call reads min(template_len, n) projected samples per band and target-domain
+        class. At a 200-sample window that is about two thirds of the call.
+        """
+        if end != self.end or start < self.start or end - start < 2:
+            return None
+        self.retire(start)
+
+        model = self.model
+        n = end - start
+        ref_mean, Syy, M = self.ref_bank.window_moments(n)
+
+        # Rotate the absolute-time sums to the window start: G = sum p * ref (window-relative)
+        theta = self.phase - self.omega * start
+        cos_theta, sin_theta = np.cos(theta), np.sin(theta)
+        G = np.empty(self._sum_cos.shape[:2] + (2 * model.num_of_harmonics,))
+        G[..., 0::2] = cos_theta * self._sum_cos - sin_theta * self._sum_sin
+        G[..., 1::2] = cos_theta * self._sum_sin + sin_theta * self._sum_cos
+
+        # g = Yc^T p and |p_centered|^2, all from the running sums
+        g = G - ref_mean[None] * self._sum[..., None]
+        p_var = np.maximum(self._sum_sq - self._sum**2 / n, 0.0)
+
+        # r1a: |Wy^T g| / sqrt(|p_c|^2 * Wy^T Syy Wy)
+        num = np.abs(np.einsum('bkc,bck->bc', model.Wy, g))
+        y_var = np.einsum('bkc,ckj,bjc->bc', model.Wy, Syy, model.Wy)
+        r1a = _ratio(num, np.sqrt(p_var * y_var)) * model.r1a_mask
+
+        # r3: |g^T M g| / (|p_c| * |Syy^1/2 M g|), the canoncorr_correlations identity
+        Mg = np.einsum('ckj,bcj->bck', M, g)
+        num = np.abs(np.sum(g * Mg, axis=-1))
+        den = np.sqrt(p_var * np.sum(Mg * np.einsum('ckj,bcj->bck', Syy, Mg), axis=-1))
+        r3 = _ratio(num, den) * model.r3_mask
+
+        # r1b: template aligned to the window start, directly from the projection history
+        r1b = np.zeros_like(r3)
+        for b in range(model.num_of_subbands):
+            template_len = min(int(model.template_len[b]), n)
+            if template_len > 10 and len(self.r1b_classes):
+                index = np.arange(start, start + template_len) % self.capacity
+                P = self._history[b][self.r1b_classes][:, index]
+                r1b[b, self.r1b_classes] = row_correlations(
+                    P, model.templates[b, :template_len][:, self.r1b_classes].T)
+        r1b *= model.r1b_mask
+
+        return np.sum(model.FB_coef[:, None] * (r1a**2 + r1b**2 + r3**2), axis=0)
+
+    def _accumulate(self, P, first_sample, sign):
+        """Add (sign=1) or remove (sign=-1) projected samples P (bands, classes, k) at first_sample"""
+        angle = self.omega[:, :, None] * np.arange(first_sample, first_sample + P.shape[-1])[None, None, :]
+        self._sum += sign * np.sum(P, axis=-1)
+        self._sum_sq += sign * np.sum(P * P, axis=-1)
+        self._sum_cos += sign * np.einsum('bct,cht->bch', P, np.cos(angle))
+        self._sum_sin += sign * np.einsum('bct,cht->bch', P, np.sin(angle))
+
+    def _refresh(self):
+        """Rebuild the running sums from the projection history"""
+        model = self.model
+        shape = (model.num_of_subbands, self.num_classes)
+        self._sum = np.zeros(shape)
+        self._sum_sq = np.zeros(shape)
+        self._sum_cos = np.zeros(shape + (model.num_of_harmonics,))
+        self._sum_sin = np.zeros(shape + (model.num_of_harmonics,))
+        if self.end > self.start:
+            index = np.arange(self.start, self.end) % self.capacity
+            self._accumulate(self._history[:, :, index], self.start, 1.0)
+        self._since_refresh = 0
+
+
+def _ratio(num, den):
+    """num / den clipped to [0, 1], 0 where den is 0"""
+    r = np.zeros(num.shape)
+    valid = den > 0
+    r[valid] = num[valid] / den[valid]
+    return np.minimum(r, 1.0)
@@ -6,12 +6,17 @@ Enhanced TLCCA real-time recognition system - supports model and data selection
 
 import numpy as np
 import scipy.io as sio
-import scipy.signal as signal
 import time
 import os
 
-class TLCCAOnlineRecognition:
-    def __init__(self, recognition_window):
+from tlcca_acquisition import AcquisitionPipeline, ReplaySource, SampleRingBuffer
+from tlcca_preprocessing import FFTFilterBank, FilteredBankCache, LinearOperatorFilterBank, TLCCAPreprocessor
+from tlcca_model import CompiledTLCCAModel, compile_char_table, format_char_table
+from tlcca_scoring import WINDOW_OPTIONS, BatchedTLCCAScorer, ScoringWorkspace, compare_scorers
+from tlcca_engine import TLCCAEngineMixin
+
+class TLCCAOnlineRecognition(TLCCAEngineMixin):
+    def __init__(self, recognition_window, scoring_precision='float64'):
         # Basic parameters
         self.Fs = 250
         self.num_of_subbands = 5
@@ -41,25 +46,52 @@ class TLCCAOnlineRecognition:
         self.pha_val = None
         self.source_freq_idx = None
         self.target_freq_idx = None
+        self.char_table = None
+        self.model = None  # CompiledTLCCAModel (read-only, shared across threads)
+        self.batched_scorer = None
+        self.scoring_dtype = np.dtype(scoring_precision)  # 'float32' for single-precision scoring
+        self.incremental_scoring = False  # Sliding-window running-sum scoring (causal filtering)
+        self.streaming_filter = False  # Streaming causal filter bank: each sample filtered once on arrival
+        self.incremental_scorer = None
+        self.causal_filter_bank = None
+        self.filtered_stream = None  # Filtered-history ring buffer (subbands, channels), absolute sample index
+        self.causal_samples = 0
+        self.canoncorr_fallback_count = 0  # Times matlab_canoncorr_exact fell back to the regularized CCA
+        self.acquisition_rate = self.Fs  # Amplifier rate; decimated to the model rate by the polyphase front-end
+        self.model_fs = self.Fs  # Rate the model was trained at ('Fs' in the model file)
+        self.adaptive_notch = False  # Per-channel notch chosen from measured line noise (see set_adaptive_notch)
+        self.line_noise_estimator = None
+        self.line_noise_samples = 0
+        self.notch_selection = None  # Mains tuple to notch per channel (() : no notch); None overall: default 50Hz
+        self.notch_preprocessors = {}
+        self.notch_banks = {}
+        self.workspace = None  # Reusable scoring workspace (see set_workspace); None: fresh arrays per decision
+        self.scoring_order = 'filter_first'  # 'project_first': score on the per-character path, filtering 1-D projections
+        self.decision_stride = 0.02  # Seconds between decisions inside the recognition interval (see set_decision_stride)
+        self.scheduler = None  # Decision scheduler of the latest run (keeps the per-decision wake-up lateness)
+        self.replay_speed = 1.0  # 1.0: real time; None: as fast as possible; k: k times real time (see set_replay_speed)
+        self.pipeline_options = None  # Acquisition/buffering/scoring pipeline settings (see set_pipeline); None: single loop
+        self.pipeline = None  # Pipeline of the latest run (queue depth, drops, per-stage latency)
+        self.decision_log = []  # Per-decision record of the latest run, independent of the replay speed
         
         # Real-time data
         self.source_data = None
-        self.streaming_buffer = None
+        self.source_generation = 0  # Bumped per loaded block: sample indices of different blocks are not comparable
+        self.streaming_buffer = None  # Raw-data ring buffer (channels), absolute sample index
         self.received_samples = 0
+        self.stream_resampler = None  # Polyphase front-end for live chunks (amplifier rate != model rate)
         self.test_eeg_data = None
+        self.filtered_bank_cache = FilteredBankCache()  # Reuse sub-band output of repeated windows
 
-        self.subband_filters = {}
-        for k in range(1, self.num_of_subbands + 1):
-            Wp = np.array([(8*k)/(self.Fs/2), 90/(self.Fs/2)])
-            Ws = np.array([(8*k-2)/(self.Fs/2), 100/(self.Fs/2)])
-            
-            try:
-                N, Wn = signal.cheb1ord(Wp, Ws, 3, 40)
-                b, a = signal.cheby1(N, 0.5, Wn, btype='band')
-                self.subband_filters[k] = {'bpB': b, 'bpA': a}
-            except:
-                b, a = signal.butter(6, Wn, btype='band')
-                self.subband_filters[k] = {'bpB': b, 'bpA': a}
+        # Notch + 5 sub-band filters (SOS) designed once, shared with the trainer
+        self.preprocessor = TLCCAPreprocessor(self.Fs, self.num_of_subbands)
+        self.filter_engine = 'filtfilt'  # 'fft': frequency-domain zero-phase bank (see set_filter_engine)
+        self.fft_filter_bank = FFTFilterBank(self.preprocessor)
+        # filtfilt as linear operators for the selectable window lengths (and their +-1 sample rounding)
+        window_lengths = [int(round(w * self.Fs)) for w in WINDOW_OPTIONS]
+        self.operator_filter_bank = LinearOperatorFilterBank(
+            self.preprocessor, [length + d for length in window_lengths for d in (-1, 0, 1)],
+            precompute_lengths=window_lengths)
 
         
         print("🧠 TLCCA real-time recognition system initialized")
@@ -154,6 +186,14 @@ class TLCCAOnlineRecognition:
         try:
             model_data = sio.loadmat(model_path)
             print(f"✅ Model loaded successfully: {model_path}")
+
+            # 🔑 Training rate: refuse a model trained at another rate, adapt faster streams via the front-end
+            self.model_fs = float(np.squeeze(model_data['Fs'])) if 'Fs' in model_data else float(self.Fs)
+            if self.model_fs != self.Fs:
+                print(f"❌ Model was trained at {self.model_fs:g}Hz, engine runs at {self.Fs}Hz - refusing to load")
+                return False
+            if not self.check_acquisition_rate(self.acquisition_rate):
+                return False
             
            
             if 'target_order' in model_data:
@@ -199,33 +239,25 @@ class TLCCAOnlineRecognition:
                     weights_loaded += 1
             
             print(f"✅ Weights loaded successfully: {weights_loaded}个")
-            
-            #  3：Verifying character-weight mapping relation
+
+            # 🔑 Compiled character table: char -> reordered pos / domain / column / freq / phase
+            self.char_table = compile_char_table(
+                self.target_order, self.sti_f, self.pha_val, self.source_freq_idx,
+                self.target_freq_idx, num_classes=len(self.beta_standard_chars))
+
+            # 🔑 Compile into a contiguous read-only model: Wx[band, ch, class], ... stacked by character
+            self.model = CompiledTLCCAModel.from_weights(
+                self.online_weights, self.online_templates, self.char_table,
+                self.FB_coef, self.num_of_harmonics, self.Fs)
+            self.batched_scorer = BatchedTLCCAScorer(self.model, dtype=self.scoring_dtype)
+            if self.workspace is not None:
+                self.set_workspace(True)
+            print(f"   {self.model.summary()}")
+            
+            #  3：Verifying character-weight mapping relation (compiled table)
             print(f"\n🔍 Verifying character-weight mapping relation:")
-            for i in range(5):
-                char = self.beta_standard_chars[i]
-                reordered_pos = None
-                for pos, orig_idx in enumerate(self.target_order):
-                    if orig_idx == i:
-                        reordered_pos = pos
-                        break
-                
-                if reordered_pos is not None:
-                    freq = self.sti_f[reordered_pos]
-                   
-                    wx_source_key = f'Wx_source_band1'
-                    wx_transfer_key = f'Wx_transfer_band1'
-                    
-                    source_weights = self.online_weights.get(wx_source_key, np.array([]))
-                    transfer_weights = self.online_weights.get(wx_transfer_key, np.array([]))
-                    
-                    source_exists = (source_weights.size > 0 and i < source_weights.shape[1] and 
-                                np.any(source_weights[:, i] != 0))
-                    transfer_exists = (transfer_weights.size > 0 and i < transfer_weights.shape[1] and 
-                                    np.any(transfer_weights[:, i] != 0))
-                    
-                    status = "✅" if (source_exists or transfer_exists) else "❌"
-                    print(f"  Character'{char}'(Original index{i}) -> Reordered position{reordered_pos} -> Frequency{freq:.1f}Hz -> Weight exists{status}")
+            print(format_char_table(self.char_table, self.beta_standard_chars[:5],
+                                    weights_ok=self.model.r3_mask[0]))
             
             return True
             
@@ -233,23 +265,6 @@ class TLCCAOnlineRecognition:
             print(f"❌ Model loading failed: {e}")
             return False
 
-    def _init_default_mapping(self):
-        """Initialize default mapping"""
-        sti_f = np.array([8.6, 8.8, 9, 9.2, 9.4, 9.6, 9.8, 10, 10.2, 10.4, 10.6, 10.8,
-                         11, 11.2, 11.4, 11.6, 11.8, 12, 12.2, 12.4, 12.6, 12.8,
-                         13, 13.2, 13.4, 13.6, 13.8, 14, 14.2, 14.4, 14.6, 14.8,
-                         15, 15.2, 15.4, 15.6, 15.8, 8, 8.2, 8.4])
-        
-        pha_val = np.array([0.0, 0.5, 1.0, 1.5] * 10)  
-        target_order = np.argsort(sti_f)  
-        sti_f = sti_f[target_order]  
-        
-        self.target_order = target_order
-        self.sti_f = sti_f
-        self.pha_val = pha_val
-        self.source_freq_idx = np.arange(1, len(sti_f), 2)
-        self.target_freq_idx = np.arange(0, len(sti_f), 2)
-
     def load_source_data(self, test_data_path, test_block):
         """Load test data from MAT file - corrected time alignment"""
         try:
@@ -276,10 +291,14 @@ class TLCCAOnlineRecognition:
                     self.char_duration = 4.0  
                 
            
-                actual_sampling_rate = 250  
+                # 🔑 Rate recorded in the data file (files written by extract_block.py have no 'Fs': the model rate);
+                # resampled by the front-end if it differs
+                actual_sampling_rate = float(np.squeeze(test_data['Fs'])) if 'Fs' in test_data else float(self.Fs)
+                if not self.check_acquisition_rate(actual_sampling_rate):
+                    return False
                 print(f"   Actual trial duration: {self.char_duration:.3f}s ")
                 print(f"   Samples per trial: {samples_per_trial}")
-                print(f"   Sampling rate: {actual_sampling_rate}Hz")
+                print(f"   Sampling rate: {actual_sampling_rate:g}Hz")
                 
    
                 total_samples = samples_per_trial * trials
@@ -289,10 +308,18 @@ class TLCCAOnlineRecognition:
                     start_col = trial_idx * samples_per_trial
                     end_col = start_col + samples_per_trial
                     self.source_data[:, start_col:end_col] = self.test_eeg_data[:, :, trial_idx]
+                if actual_sampling_rate != self.Fs:
+                    self.source_data = self.resample_stream(self.source_data, actual_sampling_rate)
+                    total_samples = self.source_data.shape[1]
+                    print(f"   Polyphase resampling: {actual_sampling_rate:g}Hz -> {self.Fs}Hz, {total_samples} samples")
                 
          
-                self.streaming_buffer = np.zeros((channels, 0))
+                # Fixed-capacity ring: memory bounded by the longest window + filter padding + 1s slack
+                self.streaming_buffer = SampleRingBuffer(channels, self.stream_capacity())
                 self.received_samples = 0
+                self.stream_resampler = None
+                self.source_generation += 1
+                self.filtered_bank_cache.clear()
                 
       
                 self.total_samples = total_samples  # Total samples
@@ -323,144 +350,65 @@ class TLCCAOnlineRecognition:
             print(f"❌ Data loading failed: {e}")
             return False
 
-    def simulate_data_streaming(self, current_time):
-        """True 250Hz real-time data stream - one sample every 4ms"""
-        
-        expected_samples = int(current_time * self.Fs)
-        
-       
-        while self.received_samples < expected_samples and self.received_samples < self.total_samples:
-           
-            new_sample = self.source_data[:, self.received_samples:self.received_samples+1]
-            
-            
-            if self.streaming_buffer.shape[1] == 0:
-                self.streaming_buffer = new_sample
-            else:
-              
-                if self.streaming_buffer.shape[1] <= self.received_samples:
-                    
-                    extension = np.zeros((self.streaming_buffer.shape[0], 1000))
-                    self.streaming_buffer = np.concatenate([self.streaming_buffer, extension], axis=1)
-                
-                self.streaming_buffer[:, self.received_samples] = new_sample.flatten()
-            
-            self.received_samples += 1
-        
-        return self.received_samples
-
-    def get_data_window(self, window_start, window_end):
-        """Get data window"""
-        start_sample = int(window_start * self.Fs)
-        end_sample = int(window_end * self.Fs)
-        available_samples = self.streaming_buffer.shape[1]
-        
-        start_sample = max(0, start_sample)
-        end_sample = min(end_sample, available_samples)
-        
-        if start_sample >= end_sample:
+    def set_acquisition_rate(self, rate):
+        """Set the amplifier rate - streams above the model rate go through the polyphase front-end"""
+        if self.check_acquisition_rate(rate):
+            self.acquisition_rate = float(rate)
+            self.stream_resampler = None  # Rebuilt for the new rate on the next live chunk
+            print(f"🔧 Amplifier rate: {rate:g}Hz -> model rate {self.model_fs:g}Hz")
+
+    def check_acquisition_rate(self, rate):
+        """Check a stream rate - only decimation is supported (upsampling cannot restore the sub-band content)"""
+        if rate < self.model_fs:
+            print(f"❌ Stream rate {rate:g}Hz is below the model's training rate {self.model_fs:g}Hz - cannot adapt")
+            return False
+        return True
+
+    def set_pipeline(self, enabled=True, chunk_duration=0.04, queue_duration=2.0, drop_when_full=False):
+        """Toggle the producer/consumer pipeline - acquisition thread -> bounded queue -> buffering thread (ring) -> scoring"""
+        if not enabled:
+            self.pipeline_options = None
+            print("🔧 Acquisition pipeline: off (single loop)")
+            return
+        self.pipeline_options = {'chunk_duration': chunk_duration, 'queue_duration': queue_duration,
+                                 'drop_when_full': drop_when_full}
+        print(f"🔧 Acquisition pipeline: on ({chunk_duration * 1000:.0f}ms chunks, {queue_duration:g}s queue, "
+              f"{'drop' if drop_when_full else 'backpressure'} when full)")
+
+    def make_acquisition_pipeline(self, scheduler):
+        """Pipeline from pipeline_options - file replay as the device, on the scheduler's clock; None when off"""
+        if self.pipeline_options is None or self.source_data is None:
             return None
-        
-        return self.streaming_buffer[:, start_sample:end_sample]
-
-    def apply_subband_filter(self, data, sub_band):
-        """Sub-band filtering - using the same filters as in training"""
-        try:
-            if data.shape[1] < 10:
-                return data
-            
-           
-            if sub_band in self.subband_filters:
-                b = self.subband_filters[sub_band]['bpB']
-                a = self.subband_filters[sub_band]['bpA']
-                filtered_data = signal.filtfilt(b, a, data, axis=1)
-                return filtered_data
-            else:
-                return data
-        except:
-            return data
-
-    def generate_reference_signals(self, freq, phase, length):
-        """Generate reference signals - standard multi-harmonics in paper"""
-        try:
-            t = np.arange(length) / self.Fs
-            ref_signals = []
-          
-            for harmonic in range(1, self.num_of_harmonics + 1):
-                harmonic_freq = freq * harmonic
-                cos_signal = np.cos(2 * np.pi * harmonic_freq * t + phase * harmonic)
-                sin_signal = np.sin(2 * np.pi * harmonic_freq * t + phase * harmonic)
-                ref_signals.extend([cos_signal, sin_signal])
-            
-            return np.array(ref_signals)  # (2*harmonics, length)
-        except:
-            return np.zeros((2*self.num_of_harmonics, length))
-
-    def calculate_correlation(self, x, y):
-        """Calculate correlation coefficient"""
-        try:
-            if len(x) != len(y) or len(x) < 2:
-                return 0.0
-            
-            x = x - np.mean(x)
-            y = y - np.mean(y)
-            
-            x_std = np.std(x)
-            y_std = np.std(y)
-            
-            if x_std == 0 or y_std == 0:
-                return 0.0
-            
-            correlation = np.corrcoef(x, y)[0, 1]
-            if np.isnan(correlation):
-                return 0.0
-            
-            return abs(correlation)
-        except:
-            return 0.0
+        chunk_samples = max(1, int(round(self.pipeline_options['chunk_duration'] * self.Fs)))
+        # As-fast-as-possible replay releases chunks unpaced (a virtual clock cannot be advanced from two
+        # threads); the bounded queue's backpressure throttles it instead
+        clock = None if self.replay_speed is None else scheduler.clock
+        drop_when_full = self.pipeline_options['drop_when_full']
+        if drop_when_full and clock is None:
+            print("⚠️ Dropping needs a paced source - as-fast-as-possible replay uses backpressure instead")
+            drop_when_full = False
+        source = ReplaySource(self.source_data, self.Fs, chunk_samples, first_sample=self.received_samples,
+                              clock=clock, sleep=scheduler.sleep)
+        queue_size = int(np.ceil(self.pipeline_options['queue_duration'] * self.Fs / chunk_samples))
+        # Buffering stage: ring buffer (through the resampling front-end) only; the stream state is
+        # brought up to each window by the scoring worker, so buffering can run ahead of it
+        return AcquisitionPipeline(source, lambda chunk: self.ingest(chunk, source.Fs), queue_size=queue_size,
+                                   drop_when_full=drop_when_full, first_sample=self.received_samples,
+                                   capacity=self.streaming_buffer.capacity, output_rate=self.Fs)
+
+    def set_replay_speed(self, speed=None):
+        """Set the replay speed - 1.0 real time, None (or 0) virtual clock as fast as possible, k k times faster; decisions and logs unchanged"""
+        self.replay_speed = None if not speed else float(speed)
+        if self.replay_speed is None:
+            print("🔧 Replay speed: as fast as possible (virtual sample clock)")
+        else:
+            print(f"🔧 Replay speed: {self.replay_speed:g}x")
 
+    def set_decision_stride(self, stride):
+        """Set the decision stride (s) - rounded to whole samples, at least one"""
+        self.decision_stride = max(1, int(round(stride * self.Fs))) / self.Fs
+        print(f"🔧 Decision stride: {self.decision_stride * 1000:.0f}ms")
 
-    def matlab_canoncorr_exact(self, X, Y):
-        """MATLAB canoncorr implementation - fully consistent with tlcca beta.py"""
-        if X.ndim == 1:
-            X = X.reshape(-1, 1)
-        if Y.ndim == 1:
-            Y = Y.reshape(-1, 1)
-        
-       
-        X = X - np.mean(X, axis=0)
-        Y = Y - np.mean(Y, axis=0)
-        
-        n = X.shape[0]
-        
-      
-        Cxx = (X.T @ X) / (n - 1)
-        Cyy = (Y.T @ Y) / (n - 1) 
-        Cxy = (X.T @ Y) / (n - 1)
-        
-        try:
-      
-            Lx = np.linalg.cholesky(Cxx + 1e-12 * np.eye(Cxx.shape[0]))
-            Ly = np.linalg.cholesky(Cyy + 1e-12 * np.eye(Cyy.shape[0]))
-            
-           
-            M = np.linalg.solve(Lx, Cxy)
-            M = np.linalg.solve(Ly.T, M.T).T
-            
-            U, s, Vt = np.linalg.svd(M, full_matrices=False)
-            
-            A = np.linalg.solve(Lx.T, U[:, 0])
-            B = np.linalg.solve(Ly.T, Vt[0, :])
-            
-            return A, B
-            
-        except:
-            # Backup solution
-            from sklearn.cross_decomposition import CCA
-            cca = CCA(n_components=1)
-            cca.fit(X, Y)
-            return cca.x_weights_[:, 0], cca.y_weights_[:, 0]
-    
     def run_real_time_recognition(self, duration=80.0):
         """Run real-time recognition - true simulation of real-time data stream"""
         print("\n" + "="*60)
@@ -471,120 +419,116 @@ class TLCCAOnlineRecognition:
         
         recognition_count = 0
         correct_count = 0
+        gap_count = 0
         trial_results = {}
         
        
-        start_real_time = time.time()
-        update_interval = 0.02  
-        window_duration = self.recognition_window  
-        if hasattr(self, 'subject_num') and self.subject_num <= 15:
-            char_duration = 3.0 
-        else:
-            char_duration = 4.0  
-        
-        while True:
-            
-            current_time = time.time() - start_real_time
-            
-            if current_time >= duration:
-                break
-            
-            
-            self.simulate_data_streaming(current_time)
-            
-         
-            current_char_idx = int(current_time / char_duration)
-            
-            if current_char_idx >= len(self.beta_standard_chars):
-                break
-            
-           
-            char_start_time = current_char_idx * char_duration
-            char_end_time = char_start_time + char_duration
-            
-   
-            
-            char_relative_time = current_time - char_start_time
-            cue_duration = 0.5  
-            physiological_delay = 0.13  
-            recognition_start_offset = cue_duration + physiological_delay  
-
-           
-            if hasattr(self, 'subject_num') and self.subject_num <= 15:
-                flicker_duration = 2.0  
+        # Streaming filter / incremental scoring: the new stream starts at sample 0
+        if self.incremental_scoring or self.streaming_filter:
+            self.reset_causal_stream()
+        if self.adaptive_notch:
+            self.reset_line_noise()
+
+        # Deadline-driven: decision instants come from the trial timeline (cue 0.5s + 0.13s latency, flicker end) and the stride
+        scheduler = self.make_decision_scheduler(duration)
+        min_samples = scheduler.min_samples
+        self.decision_log = []
+        scheduler.start()
+        self.pipeline = self.make_acquisition_pipeline(scheduler)
+        if self.pipeline is not None:
+            self.pipeline.start()
+
+        for decision in scheduler.decisions():
+            if self.pipeline is None:
+                # Sleep until the decision is due, then take in the samples up to it (independent of lateness, so runs repeat exactly)
+                scheduler.wait(decision)
+                self.simulate_data_streaming(decision.time)
+                self.update_stream_state()
+            elif self.pipeline.wait_for(decision.end_sample, self.oldest_needed_sample(decision.start_sample)):
+                # Scoring worker: the window is buffered (buffering may be further ahead); the clock wait only
+                # advances a virtual clock (the data is already late in real time) and records the lateness
+                scheduler.wait(decision)
+                self.update_stream_state(decision.end_sample)
+                if self.pipeline.window_has_gap(decision.start_sample, decision.end_sample):
+                    # Dropped chunks were zero-filled: do not score them as EEG
+                    gap_count += 1
+                    self.decision_log.append({'char_idx': decision.char_idx, 'start_sample': decision.start_sample,
+                                              'end_sample': decision.end_sample, 'predicted': None,
+                                              'correct': False, 'gap': True})
+                    print(f"⚠️ Time{decision.time:5.2f}s | Character{decision.char_idx} | "
+                          f"Window[{decision.start_sample / self.Fs:.2f}-{decision.end_sample / self.Fs:.2f}] "
+                          f"contains dropped samples - skipped")
+                    continue
             else:
-                flicker_duration = 3.0 
-
-            recognition_end_offset = cue_duration + flicker_duration  
-
-            if (char_start_time <= current_time <= char_end_time and 
-                recognition_start_offset <= char_relative_time <= recognition_end_offset):
+                break  # Source exhausted
+            decision_start = time.perf_counter()
+
+            current_char_idx = decision.char_idx
+            current_time = decision.time
+            char_start_time = current_char_idx * scheduler.char_duration
+            window_start_sample, window_end_sample = decision.start_sample, decision.end_sample
+            window_start_time = window_start_sample / self.Fs
+            window_end_time = window_end_sample / self.Fs
+
+            if window_end_sample <= self.received_samples:
+                data_window = self.streaming_buffer.window(window_start_sample, window_end_sample)
                 
-          
                
-                window_end_time = current_time
-                window_start_time = window_end_time - window_duration
-
-               
-                recognition_absolute_start = char_start_time + recognition_start_offset
-                if window_start_time < recognition_absolute_start:
-                    window_start_time = recognition_absolute_start
-                
-                
-                window_start_sample = int(window_start_time * self.Fs)
-                window_end_sample = int(window_end_time * self.Fs)
-                
-              
-                min_samples = int(max(0.2, window_duration * 0.8) * self.Fs)  
-                expected_samples = window_end_sample - window_start_sample
+                if data_window is not None and data_window.shape[1] >= min_samples:
+                    
                 
-                if (window_end_sample <= self.received_samples and 
-                    expected_samples >= min_samples):
+                    all_scores = None
+                    if self.incremental_scoring and self.incremental_scorer is not None:
+                        all_scores = self.incremental_scorer.score_window(window_start_sample, window_end_sample)
+                    elif self.streaming_filter and window_end_sample <= self.causal_samples:
+                        all_scores = self.calculate_tlcca_scores_for_all_chars(
+                            data_window, self.filtered_stream[:, :, window_start_sample:window_end_sample])
+                    if all_scores is None:
+                        all_scores = self.calculate_tlcca_scores_for_samples(
+                            window_start_sample, window_end_sample, self.streaming_buffer)
                     
-                    data_window = self.streaming_buffer[:, window_start_sample:window_end_sample]
+                   
+                    best_idx = np.argmax(all_scores)
+                    predicted_char = self.beta_standard_chars[best_idx]
+                    target_char = self.beta_standard_chars[current_char_idx]
+                   
+                    char_relative_time = current_time - char_start_time
+                    actual_window_duration = data_window.shape[1] / self.Fs
+                    
+                    is_correct = predicted_char.lower() == target_char.lower()
+                    self.decision_log.append({'char_idx': current_char_idx, 'start_sample': window_start_sample,
+                                              'end_sample': window_end_sample, 'predicted': predicted_char,
+                                              'correct': is_correct})
                     
                    
-                    if data_window.shape[1] >= min_samples:
-                        
+                    recognition_count += 1
+                    if current_char_idx not in trial_results:
+                        trial_results[current_char_idx] = {
+                            'target': target_char, 
+                            'predictions': [], 
+                            'correct': 0, 
+                            'total': 0
+                        }
                     
-                        all_scores = self.calculate_tlcca_scores_for_all_chars(data_window)
-                        
-                       
-                        best_idx = np.argmax(all_scores)
-                        predicted_char = self.beta_standard_chars[best_idx]
-                        target_char = self.beta_standard_chars[current_char_idx]
-                       
-                        char_relative_time = current_time - char_start_time
-                        actual_window_duration = data_window.shape[1] / self.Fs
-                        
-                        is_correct = predicted_char.lower() == target_char.lower()
-                        
-                       
-                        recognition_count += 1
-                        if current_char_idx not in trial_results:
-                            trial_results[current_char_idx] = {
-                                'target': target_char, 
-                                'predictions': [], 
-                                'correct': 0, 
-                                'total': 0
-                            }
-                        
-                        trial_results[current_char_idx]['predictions'].append(predicted_char)
-                        trial_results[current_char_idx]['total'] += 1
-                        
-                        if is_correct:
-                            correct_count += 1
-                            trial_results[current_char_idx]['correct'] += 1
-                        
-                      
-                        status = "✅" if is_correct else "❌"
-                        
-                        print(f"🚀 Time{current_time:5.2f}s | Samples{self.received_samples} | "
-                            f"Character{current_char_idx}('{target_char}') | Window[{window_start_time:.2f}-{window_end_time:.2f}] | "
-                            f"Relative{char_relative_time:.3f}s | Window{actual_window_duration:.2f}s | Predicted:'{predicted_char}' | {status}")
-            
-           
-            time.sleep(update_interval)
+                    trial_results[current_char_idx]['predictions'].append(predicted_char)
+                    trial_results[current_char_idx]['total'] += 1
+                    
+                    if is_correct:
+                        correct_count += 1
+                        trial_results[current_char_idx]['correct'] += 1
+                    
+                  
+                    status = "✅" if is_correct else "❌"
+                    
+                    print(f"🚀 Time{current_time:5.2f}s | Samples{window_end_sample} | "
+                        f"Character{current_char_idx}('{target_char}') | Window[{window_start_time:.2f}-{window_end_time:.2f}] | "
+                        f"Relative{char_relative_time:.3f}s | Window{actual_window_duration:.2f}s | Predicted:'{predicted_char}' | {status}")
+
+            if self.pipeline is not None:
+                self.pipeline.record_scoring(time.perf_counter() - decision_start)
+
+        if self.pipeline is not None:
+            self.pipeline.stop()
 
         
        
@@ -607,202 +551,300 @@ class TLCCAOnlineRecognition:
         print(f"   Real-time accuracy: {overall_acc:.1f}%")
         print(f"   Recognition count: {recognition_count}")
         print(f"   Average Each Character Recognition count: {recognition_count/len(trial_results):.1f}")
+        if self.canoncorr_fallback_count:
+            print(f"   CCA fallback count: {self.canoncorr_fallback_count}")
+        lateness = scheduler.lateness_summary()
+        if lateness:
+            print(f"   Decision lateness: mean {lateness['mean_ms']:.2f}ms | p95 {lateness['p95_ms']:.2f}ms | max {lateness['max_ms']:.2f}ms")
+        if self.pipeline is not None:
+            stats = self.pipeline.stats()
+            print(f"   Pipeline: max queue depth {stats['max_queue_depth']}/{stats['queue_size']} | "
+                  f"dropped {stats['dropped_chunks']} chunks ({stats['dropped_samples']} samples)")
+            if stats['gaps']:
+                print(f"   Zero-filled gaps: {stats['gaps']} ({stats['gap_samples']} samples) | "
+                      f"skipped decisions: {gap_count}")
+            for stage in ('queue_latency', 'buffer_latency', 'scoring_latency'):
+                if stats[stage]['count']:
+                    print(f"   {stage}: mean {stats[stage]['mean_ms']:.2f}ms | p95 {stats[stage]['p95_ms']:.2f}ms | "
+                          f"max {stats[stage]['max_ms']:.2f}ms")
+        if self.workspace is not None:
+            print(f"   Workspace allocations: {self.workspace.allocations} ({self.workspace.nbytes / 1024:.0f} KB)")
         
         return trial_results
 
 
 
-    def calculate_tlcca_scores_for_all_chars(self, eeg_window):
-        """Calculate TLCCA scores for all characters - consistent with tlcca beta.py logic"""
-        
-       
-        try:
-            processed_window = np.zeros_like(eeg_window)
-            
-           
-            Fo = 50
-            Q = 35
-            M = int(np.floor((self.Fs/2) / Fo))  # M=2
-            notchB = np.array([1.0])
-            notchA = np.array([1.0])
-            
-            for k in range(1, M+1):
-                w0 = (k * Fo) / (self.Fs/2)
-                b_k, a_k = signal.iirnotch(w0, Q)
-                notchB = np.convolve(notchB, b_k)
-                notchA = np.convolve(notchA, a_k)
-            
-            for ch in range(eeg_window.shape[0]):
-                processed_window[ch, :] = signal.filtfilt(notchB, notchA, eeg_window[ch, :])
-            eeg_window = processed_window
-        except:
-            pass
-        
-        
-        all_scores = []
-        
-        for char_idx in range(len(self.beta_standard_chars)):
-           
-            reordered_pos = None
-            for pos, orig_idx in enumerate(self.target_order):
-                if orig_idx == char_idx:
-                    reordered_pos = pos
-                    break
-            
-            if reordered_pos is None:
-                all_scores.append(0.0)
-                continue
-            
-           
-            freq = self.sti_f[reordered_pos]
-            phase = self.pha_val[reordered_pos]
-            Y1 = self.generate_reference_signals(freq, phase, eeg_window.shape[1])
-            
-            total_score = 0.0
-            
-           
-            for sub_band in range(1, self.num_of_subbands + 1):
-                X_filtered = self.apply_subband_filter(eeg_window, sub_band)
-                
-                
-                rho_i = self.calculate_single_char_score(X_filtered, Y1, reordered_pos, sub_band)
-                
-                fb_weight = self.FB_coef[sub_band-1]
-                total_score += fb_weight * rho_i
-            
-            all_scores.append(total_score)
-        
-        return all_scores
-
-    def calculate_single_char_score(self, X_filtered, Y1, reordered_pos, sub_band):
-        """Calculate score of a single character in one sub-band"""
-        
-        wx_source_key = f'Wx_source_band{sub_band}'
-        wy_source_key = f'Wy_source_band{sub_band}'  
-        wx_transfer_key = f'Wx_transfer_band{sub_band}'
-        templates_transfer_key = f'templates_transfer_band{sub_band}'
+    def evaluate_block_offline(self, window_duration=None):
+        """Offline evaluation of the loaded block - one window per trial, all scored in one batch"""
+        window_duration = self.recognition_window if window_duration is None else window_duration
+        sample_ranges = self.trial_sample_ranges(window_duration)
+        trials = len(sample_ranges)
+
+        start = time.perf_counter()
+        all_scores = self.score_sample_windows(sample_ranges)
+        elapsed = time.perf_counter() - start
+
+        predictions = [self.beta_standard_chars[i] for i in np.argmax(all_scores, axis=1)]
+        correct = sum(1 for i, pred in enumerate(predictions) if pred == self.beta_standard_chars[i])
+        print(f"📊 Offline evaluation: {correct}/{trials} correct ({correct / max(trials, 1) * 100:.1f}%) | "
+              f"Window {window_duration:.2f}s | {elapsed * 1000:.1f}ms")
+        return predictions, all_scores
+
+    def set_scoring_precision(self, precision):
+        """Switch scoring precision - 'float32' (single-precision projections/correlations) or 'float64'"""
+        self.scoring_dtype = np.dtype(precision)
+        if self.model is not None:
+            self.batched_scorer = BatchedTLCCAScorer(self.model, dtype=self.scoring_dtype)
+        if self.workspace is not None:
+            self.set_workspace(True)
+        print(f"🔧 Scoring precision: {self.scoring_dtype.name}")
+
+    def sample_windows(self, num_windows=40, window_duration=None):
+        """Evenly spaced equal-length windows (N, channels, samples) from the loaded data - for parity checks"""
+        if self.model is None or self.source_data is None:
+            print("❌ Model and data must be loaded first")
+            return None
 
-        r1a = r1b = r3 = 0.0
+        window_duration = self.recognition_window if window_duration is None else window_duration
+        window_samples = int(window_duration * self.Fs)
+        last_start = self.total_samples - window_samples
+        if last_start < 0:
+            print("❌ Data shorter than one window")
+            return None
 
-        
-        source_domain_idx = None
-        for i, freq_idx in enumerate(self.source_freq_idx):
-            if freq_idx == reordered_pos:
-                source_domain_idx = i
-                break
+        starts = np.unique(np.linspace(0, last_start, num_windows).astype(int))
+        return np.stack([self.source_data[:, start:start + window_samples] for start in starts])
 
-        target_domain_idx = None
-        for i, freq_idx in enumerate(self.target_freq_idx):
-            if freq_idx == reordered_pos:
-                target_domain_idx = i
-                break
+    def check_scoring_parity(self, num_windows=40, window_duration=None):
+        """Precision parity check - score the same filtered windows in float64 and float32, report deviation"""
+        windows = self.sample_windows(num_windows, window_duration)
+        if windows is None:
+            return None
+        banks = self.filter_bank(windows)
+
+        report = compare_scorers(BatchedTLCCAScorer(self.model, dtype=np.float64),
+                                 BatchedTLCCAScorer(self.model, dtype=np.float32), banks)
+        print(f"🔍 Precision parity float64 vs float32: {report['windows']} windows | "
+              f"max score deviation {report['max_score_deviation']:.2e} | "
+              f"argmax disagreements {report['argmax_disagreements']} ({report['argmax_disagreement_rate'] * 100:.2f}%)")
+        return report
+
+    def set_filter_engine(self, engine, notch_in_mask=False):
+        """Select this session's filter bank - 'filtfilt' (Chebyshev, time domain) or 'fft' (frequency masks)"""
+        if engine not in ('filtfilt', 'fft'):
+            print(f"❌ Unknown filter engine: {engine}")
+            return None
+        self.filter_engine = engine
+        self.fft_filter_bank = FFTFilterBank(self.preprocessor, notch_in_mask=notch_in_mask)
+        self.notch_banks = {}
+        self.filtered_bank_cache.clear()
+        print(f"🔧 Filter engine: {engine}" + (" (notch folded into the masks)" if engine == 'fft' and notch_in_mask else ""))
+        if engine == 'fft' and self.source_data is not None:
+            return self.report_filter_engine_deviation()
+        return None
+
+    def report_filter_engine_deviation(self, num_windows=40, window_duration=None):
+        """Deviation of the FFT filter bank from Chebyshev filtfilt - per-band relative RMS, scores, argmax"""
+        windows = self.sample_windows(num_windows, window_duration)
+        if windows is None:
+            return None
 
-        
-        if reordered_pos in self.source_freq_idx and source_domain_idx is not None:
-           
-            if wx_source_key in self.online_weights and wy_source_key in self.online_weights:
-                try:
-                    W1_x = self.online_weights[wx_source_key][:, source_domain_idx]
-                    W1_y = self.online_weights[wy_source_key][:, source_domain_idx] 
-                    
-                    if np.any(W1_x != 0) and np.any(W1_y != 0):
-                        X_proj = W1_x.T @ X_filtered
-                        Y_proj = W1_y.T @ Y1
-                        r1a = self.calculate_correlation(X_proj.flatten(), Y_proj.flatten())
-                except Exception as e:
-                    r1a = 0.0
-            
-            r1b = 0.0  
-            
-        elif reordered_pos in self.target_freq_idx and target_domain_idx is not None:
-            r1a = 0.0  
-            
-            corresponding_source_idx = target_domain_idx
-            
-            if (wx_transfer_key in self.online_weights and 
-                templates_transfer_key in self.online_templates):
-                try:
-                    W2_x = self.online_weights[wx_transfer_key][:, corresponding_source_idx]
-                    H1_r1 = self.online_templates[templates_transfer_key][:, corresponding_source_idx]
-                    
-                    if np.any(W2_x != 0) and np.any(H1_r1 != 0):
-                        X_proj = W2_x.T @ X_filtered
-                        template_len = min(len(H1_r1), len(X_proj))
-                        if template_len > 10:
-                            r1b = self.calculate_correlation(
-                                X_proj[:template_len].flatten(), 
-                                H1_r1[:template_len].flatten()
-                            )
-                except Exception as e:
-                    r1b = 0.0
+        reference = self.preprocessor.filter_bank(windows)
+        candidate = self.fft_filter_bank.filter_bank(windows)
+        band_rms = np.sqrt(np.mean((candidate - reference) ** 2, axis=(0, 2, 3)) /
+                           np.maximum(np.mean(reference ** 2, axis=(0, 2, 3)), 1e-30))
+        report = {'windows': len(windows), 'band_relative_rms_deviation': band_rms.tolist()}
+        if self.batched_scorer is not None:
+            ref_scores = self.batched_scorer.score_batch(reference)
+            fft_scores = self.batched_scorer.score_batch(candidate)
+            report['max_score_deviation'] = float(np.max(np.abs(ref_scores - fft_scores)))
+            report['argmax_agreement'] = float(np.mean(np.argmax(ref_scores, axis=1) == np.argmax(fft_scores, axis=1)))
+
+        print(f"🔍 FFT filter bank vs filtfilt ({report['windows']} windows): band relative RMS deviation "
+              + " / ".join(f"{d * 100:.1f}%" for d in band_rms)
+              + (f" | max score deviation {report['max_score_deviation']:.3f} | argmax agreement {report['argmax_agreement'] * 100:.1f}%"
+                 if 'argmax_agreement' in report else ""))
+        return report
+
+    def set_scoring_order(self, order):
+        """Scoring order - 'filter_first' (filter 9 channels, then project) or 'project_first'
+
+        project_first scores every window on the per-character path, which projects the notched
+        window through each character's Wx and band-pass filters only that trace. It replaces the
+        batched kernel (and its filtered-bank cache); incremental scoring, when on, still takes precedence.
+        """
+        if order not in ('filter_first', 'project_first'):
+            print(f"❌ Unknown scoring order: {order}")
+            return
+        self.scoring_order = order
+        print(f"🔧 Scoring order: {order}" + (" (per-character path)" if order == 'project_first' else ""))
+
+    def validate_projection_order(self, num_windows=10, window_duration=None):
+        """Validate project_first against filter_first on the per-character path - scores, argmax, timing"""
+        windows = self.sample_windows(num_windows, window_duration)
+        if windows is None:
+            return None
 
-      
-        if reordered_pos in self.source_freq_idx and source_domain_idx is not None:
-            if wx_source_key in self.online_weights:
-                try:
-                    W1_x = self.online_weights[wx_source_key][:, source_domain_idx]
-                    if np.any(W1_x != 0):
-                        try:
-                           
-                            filtered_test_signal = W1_x.T @ X_filtered
-                            filtered_test_reshaped = filtered_test_signal.reshape(-1, 1)
-                            ref1_reshaped = Y1.T
-                            
-                            A1, B1 = self.matlab_canoncorr_exact(filtered_test_reshaped, ref1_reshaped)
-                            proj1 = filtered_test_reshaped @ A1.reshape(-1, 1)
-                            proj2 = ref1_reshaped @ B1.reshape(-1, 1)
-                            r3 = self.calculate_correlation(proj1.flatten(), proj2.flatten())
-                        except:
-                            
-                            min_len = min(len(filtered_test_signal), Y1.shape[1])
-                            r3 = self.calculate_correlation(
-                                filtered_test_signal[:min_len], 
-                                Y1[0, :min_len]
-                            )
-                except Exception as e:
-                    r3 = 0.0
-                    
-        elif reordered_pos in self.target_freq_idx and target_domain_idx is not None:
-            corresponding_source_idx = target_domain_idx
-            if wx_transfer_key in self.online_weights:
-                try:
-                    W1_x = self.online_weights[wx_transfer_key][:, corresponding_source_idx]
-                    if np.any(W1_x != 0):
-                        try:
-                            
-                            filtered_test_signal = W1_x.T @ X_filtered
-                            filtered_test_reshaped = filtered_test_signal.reshape(-1, 1)
-                            ref1_reshaped = Y1.T
-                            
-                            A1, B1 = self.matlab_canoncorr_exact(filtered_test_reshaped, ref1_reshaped)
-                            proj1 = filtered_test_reshaped @ A1.reshape(-1, 1)
-                            proj2 = ref1_reshaped @ B1.reshape(-1, 1)
-                            r3 = self.calculate_correlation(proj1.flatten(), proj2.flatten())
-                        except:
-                            
-                            min_len = min(len(filtered_test_signal), Y1.shape[1])
-                            r3 = self.calculate_correlation(
-                                filtered_test_signal[:min_len], 
-                                Y1[0, :min_len]
-                            )
-                except Exception as e:
-                    r3 = 0.0
+        previous_order = self.scoring_order
+        results = {}
+        try:
+            for order in ('filter_first', 'project_first'):
+                self.scoring_order = order
+                start = time.perf_counter()
+                results[order] = np.array([self.calculate_tlcca_scores_loop(window) for window in windows])
+                results[order + '_ms'] = (time.perf_counter() - start) * 1000 / len(windows)
+        finally:
+            self.scoring_order = previous_order
+
+        reference, candidate = results['filter_first'], results['project_first']
+        disagreements = int(np.sum(np.argmax(reference, axis=1) != np.argmax(candidate, axis=1)))
+        report = {
+            'windows': len(windows),
+            'max_score_deviation': float(np.max(np.abs(reference - candidate))),
+            'argmax_disagreements': disagreements,
+            'filter_first_ms': results['filter_first_ms'],
+            'project_first_ms': results['project_first_ms'],
+        }
+        print(f"🔍 project_first vs filter_first: {report['windows']} windows | "
+              f"max score deviation {report['max_score_deviation']:.2e} | argmax disagreements {disagreements} | "
+              f"per window {report['filter_first_ms']:.1f}ms -> {report['project_first_ms']:.1f}ms")
+        return report
+
+    def set_adaptive_notch(self, enabled=True):
+        """Adaptive notch - measure 50/60Hz harmonic noise per channel, notch only channels that carry it"""
+        self.adaptive_notch = enabled
+        self.reset_line_noise()
+        print(f"🔧 Adaptive notch: {'on' if enabled else 'off (fixed 50Hz notch)'}")
+
+    def update_line_noise(self, data=None, until=None):
+        """Update the line-noise estimate (new streaming-buffer samples up to `until` by default), switch notches on change"""
+        if self.line_noise_estimator is None:
+            return
+        if data is None:
+            until = self.received_samples if until is None else until
+            if until <= self.line_noise_samples:
+                return
+            data = self.streaming_buffer[:, self.line_noise_samples:until]
+            self.line_noise_samples = until
+        self.line_noise_estimator.update(data)
+
+        selection = self.line_noise_estimator.select()
+        if selection is not None and selection != self.notch_selection:
+            self.notch_selection = selection
+            self.filtered_bank_cache.clear()  # Cached banks were filtered with the old notch
+            summary = ", ".join(f"{self.notch_label(mains)}: {selection.count(mains)} ch"
+                                for mains in sorted(set(selection)))
+            print(f"🔌 Line-noise estimate updated the notch selection: {summary}")
+
+    def report_line_noise(self):
+        """Per-channel mains harmonic power over neighbouring bins (dB) and the current notch selection"""
+        if self.line_noise_estimator is None or self.line_noise_estimator.power is None:
+            print("⚠️ No line-noise estimate yet")
+            return None
+        ratios = self.line_noise_estimator.line_to_floor_db()
+        for ch in range(self.line_noise_estimator.channels):
+            levels = " | ".join(f"{mains}Hz {ratios[mains][ch]:+5.1f}dB" for mains in ratios)
+            chosen = self.notch_selection[ch] if self.notch_selection is not None else (50,)
+            print(f"   Channel {ch}: {levels} -> notch {self.notch_label(chosen)}")
+        return {'line_to_floor_db': ratios, 'selection': self.notch_selection}
+
+    def notch_label(self, mains):
+        """Display text of a notch choice"""
+        return "+".join(f"{f0}Hz" for f0 in mains) or "none"
+
+    def set_workspace(self, enabled=True):
+        """Preallocated scoring workspace - sized once for the longest window (1.2s) and bands/classes, reused"""
+        if not enabled or self.batched_scorer is None:
+            self.workspace = None
+            return None
+        channels = self.model.Wx.shape[1]
+        max_len = int(round(max(WINDOW_OPTIONS) * self.Fs)) + 1
+        workspace = self.batched_scorer.reserve_workspace(ScoringWorkspace(self.scoring_dtype), channels, max_len)
+        self.workspace = self.reserve_filter_workspace(workspace, channels, max_len)
+        print(f"🔧 Scoring workspace: {self.workspace.nbytes / 1024:.0f} KB, longest window {max_len} samples")
+        return self.workspace
+
+    def report_workspace_allocations(self, num_windows=20, window_duration=None):
+        """Diagnostics - workspace allocation count and per-decision transient memory peak (tracemalloc)"""
+        import tracemalloc
+
+        windows = self.sample_windows(num_windows, window_duration)
+        if windows is None or self.batched_scorer is None:
+            return None
+        workspace = self.workspace if self.workspace is not None else self.set_workspace(True)
+
+        peaks = {}
+        for name, active in (('without_workspace', None), ('with_workspace', workspace)):
+            self.workspace = active
+            for window in windows:  # Warm-up: references and operators cached per length
+                self.calculate_tlcca_scores_for_all_chars(window)
+            allocations_before = workspace.allocations
+            tracemalloc.start()
+            peak = 0
+            for window in windows:
+                current = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                self.calculate_tlcca_scores_for_all_chars(window)
+                peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+            tracemalloc.stop()
+            peaks[name] = peak
+        self.workspace = workspace
+
+        report = {
+            'workspace_allocations': workspace.allocations,
+            'steady_state_allocations': workspace.allocations - allocations_before,
+            'workspace_bytes': workspace.nbytes,
+            'peak_bytes_without_workspace': peaks['without_workspace'],
+            'peak_bytes_with_workspace': peaks['with_workspace'],
+        }
+        print(f"🧮 Workspace: {report['workspace_allocations']} allocations "
+              f"({report['steady_state_allocations']} in steady state), {report['workspace_bytes'] / 1024:.0f} KB | "
+              f"per-decision transient peak {report['peak_bytes_without_workspace'] / 1024:.1f} KB -> "
+              f"{report['peak_bytes_with_workspace'] / 1024:.1f} KB")
+        return report
+
+    def set_incremental_scoring(self, enabled=True):
+        """Toggle incremental scoring - causal filtering + running sums, each decision only touches new samples"""
+        self.incremental_scoring = enabled
+        print(f"🔧 Incremental sliding-window scoring: {'on (causal filtering)' if enabled else 'off (per-window filtfilt)'}")
+
+    def set_streaming_filter(self, enabled=True):
+        """Toggle the streaming filter bank - causal SOS filtering once per sample, scoring reads filtered history"""
+        self.streaming_filter = enabled
+        print(f"🔧 Streaming filter bank: {'on (causal SOS)' if enabled else 'off (per-window filtfilt)'}")
+
+    def compare_streaming_filter_accuracy(self, window_duration=None):
+        """Causal streaming filtering vs per-window filtfilt - accuracy on the loaded block"""
+        if self.batched_scorer is None or self.source_data is None:
+            print("❌ Model and data must be loaded first")
+            return None
 
-        
-        rho_i = (np.sign(r1a) * r1a**2 + np.sign(r1b) * r1b**2 + np.sign(r3) * r3**2)
-        
-        return rho_i
-    def precise_sleep_until(self, target_time):
-        """High-precision sleep until target time"""
-        while True:
-            current = time.time()
-            remaining = target_time - current
-            if remaining <= 0:
-                break
-            if remaining > 0.001:
-                time.sleep(remaining - 0.001)
-            else:
-                time.sleep(0.0001)  
+        sample_ranges = self.trial_sample_ranges(window_duration)
+        filtfilt_scores = self.score_sample_windows(sample_ranges)
+
+        # Filter the whole block causally in stream order (chunking gives the same result)
+        causal_bank = self.make_causal_filter_bank().process(self.source_data)
+        causal_scores = np.zeros_like(filtfilt_scores)
+        for i, (start_sample, end_sample) in enumerate(sample_ranges):
+            if end_sample > start_sample:
+                causal_scores[i] = self.batched_scorer.score(causal_bank[:, :, start_sample:end_sample])
+
+        targets = np.arange(len(sample_ranges))
+        filtfilt_pred = np.argmax(filtfilt_scores, axis=1)
+        causal_pred = np.argmax(causal_scores, axis=1)
+        report = {
+            'trials': len(sample_ranges),
+            'filtfilt_accuracy': float(np.mean(filtfilt_pred == targets)),
+            'streaming_accuracy': float(np.mean(causal_pred == targets)),
+            'prediction_agreement': float(np.mean(filtfilt_pred == causal_pred)),
+            'score_correlation': float(np.mean([np.corrcoef(a, b)[0, 1]
+                                                for a, b in zip(filtfilt_scores, causal_scores)
+                                                if np.std(a) > 0 and np.std(b) > 0] or [0.0])),
+        }
+        print(f"📊 Filtering comparison ({report['trials']} trials): filtfilt {report['filtfilt_accuracy'] * 100:.1f}% | "
+              f"streaming causal {report['streaming_accuracy'] * 100:.1f}% | agreement {report['prediction_agreement'] * 100:.1f}% | "
+              f"score correlation {report['score_correlation']:.3f}")
+        return report
 
 def main():
     """Main function - supports selecting different Subjects and Blocks"""
@@ -900,6 +942,19 @@ def main():
         return
     
   
+    while True:
+        try:
+            speed_choice = input("Replay speed (Enter=real time, 0=as fast as possible, k=k x real time): ").strip()
+            if speed_choice == "":
+                break
+            speed = float(speed_choice)
+            if speed >= 0:
+                tlcca.set_replay_speed(speed)
+                break
+            print("❌ Replay speed cannot be negative")
+        except ValueError:
+            print("❌ Please enter a valid number")
+
     total_data_duration = 120.0  # 40Character × 3.0秒 = 120秒
     print(f"\n✨ Start real-time recognition (total_data_duration: {total_data_duration:.1f}s)...")
  